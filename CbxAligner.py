@@ -6,8 +6,12 @@ Created on Mon May 27 10:23:19 2024
 @author: cubAIx
 """
 
+import bisect
+import numpy as np
 from CbxTokenizer import CbxTokenizer
 from CbxTokenizer import CbxToken
+from CbxTokenizer import CbxTokenStream, CbxVocab
+from metrics import time_stage
 
 class CbxAligner:
     # Cost constants
@@ -16,9 +20,38 @@ class CbxAligner:
     _COST_WORD_MISMATCH = 10
     _COST_APOSTROPHE_MISMATCH = 5  # Lower cost for matching words that differ only by apostrophe
     
-    def __init__(self):
+    # DP engines
+    ENGINE_PYTHON = "python"
+    ENGINE_NUMPY = "numpy"
+    
+    # Alignment strategies: one DP over the whole song, one per lyric section, or
+    # DP only between anchor words
+    STRATEGY_FULL = "full"
+    STRATEGY_SECTIONS = "sections"
+    STRATEGY_ANCHORS = "anchors"
+    
+    # Above this many DP cells alignToks switches to the linear-memory mode
+    _LINEAR_THRESHOLD_CELLS = 4000000
+    # Rectangles this small are solved with a full choices matrix in linear mode
+    _LINEAR_BLOCK_CELLS = 65536
+    
+    # Anchors per word of the shorter stream below which the anchor strategy runs the full DP
+    _ANCHOR_MIN_DENSITY = 0.1
+    # Levels of re-anchoring inside the gaps between anchors
+    _ANCHOR_MAX_DEPTH = 4
+    # Lyric lines on each side of a section boundary re-aligned across the boundary
+    _SECTION_MARGIN_LINES = 3
+    
+    def __init__(self, engine=ENGINE_PYTHON, linear_threshold=_LINEAR_THRESHOLD_CELLS, strategy=STRATEGY_FULL):
+        if engine not in (self.ENGINE_PYTHON, self.ENGINE_NUMPY):
+            raise ValueError(f"Unknown alignment engine: {engine}")
+        if strategy not in (self.STRATEGY_FULL, self.STRATEGY_SECTIONS, self.STRATEGY_ANCHORS):
+            raise ValueError(f"Unknown alignment strategy: {strategy}")
         self.tokenizer = CbxTokenizer()
         self.compressPosFactor = 1.0/1000000.0
+        self.engine = engine
+        self.linearThreshold = linear_threshold
+        self.strategy = strategy
     
     def syncMarks1to2(self, xml1, xml2):
         print("\nCbxAligner.syncMarks1to2:")
@@ -75,22 +108,298 @@ class CbxAligner:
         return result
     
     def alignXml(self, xml1, xml2):
-        toks1 = self.tokenizer.tokenize_lyrics(xml1)  # Use lyrics tokenizer
-        toks2 = self.tokenizer.tokenize_lyrics(xml2)
+        # Use lyrics tokenizer; compact streams share a vocabulary so words compare as ints
+        vocab = CbxVocab()
+        toks1 = self.tokenizer.tokenize_lyrics_compact(xml1, vocab)
+        toks2 = self.tokenizer.tokenize_lyrics_compact(xml2, vocab)
         return self.alignToks(toks1, toks2)
         
     def alignToks(self, toks1, toks2):
+        with time_stage("align"):
+            return self._alignToks(toks1, toks2)
+        
+    def _alignToks(self, toks1, toks2):
+        if self.strategy == self.STRATEGY_SECTIONS:
+            return self.alignToksSections(toks1, toks2)
+        if self.strategy == self.STRATEGY_ANCHORS:
+            return self.alignToksAnchored(toks1, toks2)
+        return self._alignFull(toks1, toks2)
+        
+    def _alignFull(self, toks1, toks2, cumulative=False):
+        if self.linearThreshold is not None and len(toks1) * len(toks2) > self.linearThreshold:
+            return self.alignToksLinear(toks1, toks2, cumulative)
+        if self.engine == self.ENGINE_NUMPY:
+            return self.alignToksNumpy(toks1, toks2, cumulative)
+        return self.alignToksPython(toks1, toks2, cumulative)
+        
+    def alignToksSections(self, toks1, toks2):
+        """Align toks1 (transcript) to toks2 (lyrics) one lyric section at a time.
+        
+        toks2 is split at its SECTION_HEADER tokens. A coarse line-level DP matches
+        transcript lines (one per timed block) to lyric lines, which places every
+        section boundary in toks1; each (transcript window, section) pair is then
+        aligned with the full DP, so the work is the sum of the section sizes
+        squared. Sections whose tokens and window are identical to an earlier one
+        (a repeated chorus sung the same way) reuse its alignment. Subproblems
+        charge every leading/trailing gap (cumulative borders), since a skipped
+        line inside the song is not free. The coarse pass can put a line on the
+        wrong side of a boundary, so the pairs within _SECTION_MARGIN_LINES lyric
+        lines of each boundary are aligned again as one window."""
+        kinds1, ids1, kinds2, ids2 = self._encode_toks(toks1, toks2)
+        spans = self._section_spans(kinds1, ids1, kinds2, ids2)
+        if spans is None or len(spans) < 2:
+            return self._alignFull(toks1, toks2)
+        
+        # One DP per distinct subproblem; moves are (has tok1, has tok2) steps
+        def moves(a1, b1, a2, b2):
+            return [(t1 is not None, t2 is not None) for t1, t2 in self._alignFull(toks1[a1:b1], toks2[a2:b2], cumulative=True)]
+        
+        solved = {}
+        pairs = []
+        for a1, b1, a2, b2 in spans:
+            key = (ids1[a1:b1].tobytes(), kinds1[a1:b1].tobytes(), ids2[a2:b2].tobytes(), kinds2[a2:b2].tobytes())
+            if key not in solved:
+                solved[key] = moves(a1, b1, a2, b2)
+            x, y = a1, a2
+            for has1, has2 in solved[key]:
+                pairs.append((toks1[x] if has1 else None, toks2[y] if has2 else None))
+                x += has1
+                y += has2
+        return self._realign_boundaries(toks1, toks2, pairs, [a2 for _, _, a2, _ in spans[1:]])
+    
+    def _realign_boundaries(self, toks1, toks2, pairs, starts2):
+        """Re-solve the pairs within _SECTION_MARGIN_LINES lyric lines of each section start with the full DP"""
+        def is_break(pair):
+            return pair[1] is not None and pair[1].kind == CbxToken.LINE_BREAK
+        
+        b = 0
+        for y in starts2:
+            # Boundaries move as earlier windows are re-solved; find this section's first lyric token
+            header = toks2[y]
+            while pairs[b][1] is not header:
+                b += 1
+            lo, seen = b, 0
+            while lo > 0 and not (is_break(pairs[lo - 1]) and seen == self._SECTION_MARGIN_LINES):
+                seen += is_break(pairs[lo - 1])
+                lo -= 1
+            hi, seen = b, 0
+            while hi < len(pairs) and seen < self._SECTION_MARGIN_LINES:
+                seen += is_break(pairs[hi])
+                hi += 1
+            window = pairs[lo:hi]
+            window1 = [tok1 for tok1, _ in window if tok1 is not None]
+            window2 = [tok2 for _, tok2 in window if tok2 is not None]
+            pairs[lo:hi] = self._alignFull(window1, window2, cumulative=True)
+            b = lo
+        return pairs
+    
+    def alignToksAnchored(self, toks1, toks2):
+        """Patience-diff style alignment: DP only between anchor words.
+        
+        Anchors are words occurring exactly once in each stream, kept in
+        increasing order in both (longest increasing subsequence). They are
+        matched directly; common leading/trailing tokens of each gap are matched
+        too, each gap is re-anchored on the words unique within it, and what is
+        left is aligned with the full DP. Near-identical streams are aligned in
+        close to linear time. With fewer anchors than _ANCHOR_MIN_DENSITY per
+        word the whole problem goes to the full DP."""
+        enc = self._encode_toks(toks1, toks2)
+        kinds1, ids1, kinds2, ids2 = enc
+        n, m = len(toks1), len(toks2)
+        anchors = self._anchors(enc, 0, n, 0, m)
+        words = min(np.count_nonzero(self._word_mask(kinds1)), np.count_nonzero(self._word_mask(kinds2)))
+        if not anchors or len(anchors) < self._ANCHOR_MIN_DENSITY * words:
+            return self._alignFull(toks1, toks2)
+        pairs = []
+        self._align_anchored(toks1, toks2, enc, 0, n, 0, m, 0, pairs, anchors)
+        return pairs
+    
+    def _word_mask(self, kinds):
+        return (kinds == CbxToken.WORD) | (kinds == CbxToken.WORD_WITH_APOSTROPHE)
+    
+    def _anchors(self, enc, x0, x1, y0, y1):
+        """(x, y) positions of the words unique in both toks1[x0:x1] and toks2[y0:y1], increasing in both"""
+        kinds1, ids1, kinds2, ids2 = enc
+        
+        def unique_words(kinds, ids, start, end):
+            positions = np.flatnonzero(self._word_mask(kinds[start:end])) + start
+            words, first, counts = np.unique(ids[positions], return_index=True, return_counts=True)
+            return words[counts == 1], positions[first[counts == 1]]
+        
+        words1, pos1 = unique_words(kinds1, ids1, x0, x1)
+        words2, pos2 = unique_words(kinds2, ids2, y0, y1)
+        _, k1, k2 = np.intersect1d(words1, words2, assume_unique=True, return_indices=True)
+        order = np.argsort(pos1[k1])
+        xs, ys = pos1[k1][order], pos2[k2][order]
+        
+        # Longest increasing subsequence of ys (patience sorting)
+        tails, tail_idx, back = [], [], [-1] * len(ys)
+        for k, y in enumerate(ys):
+            t = bisect.bisect_left(tails, y)
+            if t == len(tails):
+                tails.append(y)
+                tail_idx.append(k)
+            else:
+                tails[t] = y
+                tail_idx[t] = k
+            back[k] = tail_idx[t - 1] if t > 0 else -1
+        chain = []
+        k = tail_idx[-1] if tail_idx else -1
+        while k >= 0:
+            chain.append((int(xs[k]), int(ys[k])))
+            k = back[k]
+        return chain[::-1]
+    
+    def _align_anchored(self, toks1, toks2, enc, x0, x1, y0, y1, depth, pairs, anchors=None):
+        """Append the alignment of toks1[x0:x1] with toks2[y0:y1] to pairs"""
+        kinds1, ids1, kinds2, ids2 = enc
+        
+        # Match the common prefix and suffix directly
+        k = min(x1 - x0, y1 - y0)
+        same = (ids1[x0:x0 + k] == ids2[y0:y0 + k]) & (kinds1[x0:x0 + k] == kinds2[y0:y0 + k])
+        prefix = k if same.all() else int(np.argmin(same))
+        pairs.extend((toks1[x0 + i], toks2[y0 + i]) for i in range(prefix))
+        x0, y0 = x0 + prefix, y0 + prefix
+        k = min(x1 - x0, y1 - y0)
+        same = (ids1[x1 - k:x1] == ids2[y1 - k:y1]) & (kinds1[x1 - k:x1] == kinds2[y1 - k:y1])
+        suffix = k if same.all() else int(np.argmin(same[::-1]))
+        x1, y1 = x1 - suffix, y1 - suffix
+        
+        if x0 == x1 or y0 == y1:
+            pairs.extend((toks1[x], None) for x in range(x0, x1))
+            pairs.extend((None, toks2[y]) for y in range(y0, y1))
+        else:
+            if anchors is not None:
+                # Anchors computed before the prefix/suffix trim: keep those inside the gap
+                anchors = [(ax, ay) for ax, ay in anchors if x0 <= ax < x1 and y0 <= ay < y1]
+            elif depth < self._ANCHOR_MAX_DEPTH:
+                anchors = self._anchors(enc, x0, x1, y0, y1)
+            if anchors:
+                x, y = x0, y0
+                for ax, ay in anchors:
+                    self._align_anchored(toks1, toks2, enc, x, ax, y, ay, depth + 1, pairs)
+                    pairs.append((toks1[ax], toks2[ay]))
+                    x, y = ax + 1, ay + 1
+                self._align_anchored(toks1, toks2, enc, x, x1, y, y1, depth + 1, pairs)
+            else:
+                pairs.extend(self._alignFull(toks1[x0:x1], toks2[y0:y1]))
+        pairs.extend((toks1[x1 + i], toks2[y1 + i]) for i in range(suffix))
+    
+    def _line_units(self, kinds):
+        """(start, end) token ranges of the lines of a stream; section headers are units of their own"""
+        units = []
+        start = 0
+        for i, kind in enumerate(kinds):
+            if kind == CbxToken.SECTION_HEADER:
+                if start < i:
+                    units.append((start, i))
+                units.append((i, i + 1))
+                start = i + 1
+            elif kind == CbxToken.LINE_BREAK:
+                units.append((start, i + 1))
+                start = i + 1
+        if start < len(kinds):
+            units.append((start, len(kinds)))
+        return units
+    
+    def _section_spans(self, kinds1, ids1, kinds2, ids2):
+        """(start1, end1, start2, end2) token ranges per lyric section, or None without sections"""
+        n, m = len(kinds1), len(kinds2)
+        headers = kinds2 == CbxToken.SECTION_HEADER
+        if not headers.any() or n == 0:
+            return None
+        # Section of each lyric token: tokens before the first header are section 0
+        section2 = np.cumsum(headers)
+        units1 = self._line_units(kinds1)
+        units2 = [u for u in self._line_units(kinds2) if kinds2[u[0]] != CbxToken.SECTION_HEADER]
+        if not units2:
+            return None
+        
+        # Transcript line -> section, from the coarse path; transcript lines before
+        # the first matched lyric line go to the first section
+        current = int(section2[units2[0][0]])
+        section1 = []
+        for i1, i2 in self._coarse_line_path(units1, ids1, kinds1, units2, ids2, kinds2):
+            if i2 is not None:
+                current = int(section2[units2[i2][0]])
+            if i1 is not None:
+                section1.append(current)
+        
+        # A section's window starts at its first transcript line (the first one at 0)
+        sections = np.unique(section2)
+        bounds1 = [units1[k][0] if k < len(units1) else n for k in np.searchsorted(section1, sections)] + [n]
+        bounds1[0] = 0
+        bounds2 = list(np.searchsorted(section2, sections)) + [m]
+        return [(int(bounds1[k]), int(bounds1[k + 1]), int(bounds2[k]), int(bounds2[k + 1])) for k in range(len(sections))]
+    
+    def _coarse_line_path(self, units1, ids1, kinds1, units2, ids2, kinds2):
+        """Alignment of two line lists as (i1 or None, i2 or None) steps.
+        
+        Lines cost 100 to skip and 200 * (1 - shared words / words of the longer
+        line) to match."""
+        words1 = (kinds1 == CbxToken.WORD) | (kinds1 == CbxToken.WORD_WITH_APOSTROPHE)
+        words2 = (kinds2 == CbxToken.WORD) | (kinds2 == CbxToken.WORD_WITH_APOSTROPHE)
+        vocab = {int(w): k for k, w in enumerate(np.intersect1d(ids1[words1], ids2[words2]))}
+        
+        def incidence(units, ids, words):
+            inc = np.zeros((len(units), max(len(vocab), 1)), dtype=np.float32)
+            sizes = np.zeros(len(units), dtype=np.float32)
+            for u, (start, end) in enumerate(units):
+                line = set(int(w) for w in ids[start:end][words[start:end]])
+                sizes[u] = len(line)
+                inc[u, [vocab[w] for w in line if w in vocab]] = 1
+            return inc, sizes
+        
+        inc1, sizes1 = incidence(units1, ids1, words1)
+        inc2, sizes2 = incidence(units2, ids2, words2)
+        shared = inc1 @ inc2.T
+        sim = shared / np.maximum(np.maximum(sizes1[:, None], sizes2[None, :]), 1)
+        sub = np.rint(200 * (1 - sim)).astype(np.int64)
+        
+        # Row-by-row DP with a uniform gap cost of 100 (same tie-breaking as the token DP)
+        L1, L2 = len(units1), len(units2)
+        gap_cum = np.arange(L2 + 1, dtype=np.int64) * 100
+        prev = gap_cum.copy()
+        choices = np.zeros((L1 + 1, L2 + 1), dtype=np.int8)
+        choices[1:, 0] = 1
+        choices[0, 1:] = 2
+        for x in range(1, L1 + 1):
+            cost_diag = prev[:-1] + sub[x - 1]
+            cost_left = prev[1:] + 100
+            best = np.concatenate(([x * 100], np.minimum(cost_diag, cost_left)))
+            cur = gap_cum + np.minimum.accumulate(best - gap_cum)
+            cost_up = cur[:-1] + 100
+            choices[x, 1:] = np.where((cost_diag <= cost_left) & (cost_diag <= cost_up), 0, np.where(cost_left <= cost_up, 1, 2))
+            prev = cur
+        
+        path = []
+        x, y = L1, L2
+        while x > 0 or y > 0:
+            choice = choices[x, y]
+            if choice == 0:
+                path.append((x - 1, y - 1))
+                x -= 1
+                y -= 1
+            elif choice == 1:
+                path.append((x - 1, None))
+                x -= 1
+            else:
+                path.append((None, y - 1))
+                y -= 1
+        return reversed(path)
+    
+    def alignToksPython(self, toks1, toks2, cumulative=False):
         # Init matrix
         choices = [[0 for y in range(len(toks2) + 1)] for x in range(len(toks1) + 1)]
         costs = [[0 for y in range(len(toks2) + 1)] for x in range(len(toks1) + 1)]
         
-        # Initialize first row and column
+        # Initialize first row and column (a single gap cost unless cumulative)
         for x in range(1, len(toks1) + 1):
             choices[x][0] = 1  # Left
-            costs[x][0] = self._calculate_gap_cost(toks1[x-1])
+            costs[x][0] = self._calculate_gap_cost(toks1[x-1]) + (costs[x-1][0] if cumulative else 0)
         for y in range(1, len(toks2) + 1):
             choices[0][y] = 2  # Up
-            costs[0][y] = self._calculate_gap_cost(toks2[y-1])
+            costs[0][y] = self._calculate_gap_cost(toks2[y-1]) + (costs[0][y-1] if cumulative else 0)
         
         # Fill the matrix
         for x in range(1, len(toks1) + 1):
@@ -116,13 +425,191 @@ class CbxAligner:
         # Backtrack to get alignment
         return self._backtrack(choices, toks1, toks2)
     
+    def alignToksNumpy(self, toks1, toks2, cumulative=False):
+        """Same DP as alignToksPython, filled one anti-diagonal at a time with array ops"""
+        n, m = len(toks1), len(toks2)
+        kinds1, ids1, kinds2, ids2 = self._encode_toks(toks1, toks2)
+        gap1 = self._gap_costs(kinds1)
+        gap2 = self._gap_costs(kinds2)
+        sub = self._match_cost_matrix(kinds1, ids1, kinds2, ids2)
+        
+        # Init matrix (first row/column hold the single gap cost, as in alignToksPython)
+        choices = np.zeros((n + 1, m + 1), dtype=np.int8)
+        costs = np.zeros((n + 1, m + 1), dtype=np.int32)
+        choices[1:, 0] = 1  # Left
+        costs[1:, 0] = np.cumsum(gap1) if cumulative else gap1
+        choices[0, 1:] = 2  # Up
+        costs[0, 1:] = np.cumsum(gap2) if cumulative else gap2
+        
+        # Cells on anti-diagonal x+y=d only depend on diagonals d-1 and d-2
+        for d in range(2, n + m + 1):
+            x = np.arange(max(1, d - m), min(n, d - 1) + 1)
+            y = d - x
+            cost_diag = costs[x - 1, y - 1] + sub[x - 1, y - 1]
+            cost_left = costs[x - 1, y] + gap1[x - 1]
+            cost_up = costs[x, y - 1] + gap2[y - 1]
+            
+            # Same tie-breaking as alignToksPython: diagonal, then left, then up
+            left_le_up = cost_left <= cost_up
+            diag = (cost_diag <= cost_left) & (cost_diag <= cost_up)
+            choices[x, y] = np.where(diag, 0, np.where(left_le_up, 1, 2))
+            costs[x, y] = np.minimum(cost_diag, np.where(left_le_up, cost_left, cost_up))
+        
+        # Backtrack to get alignment
+        return self._backtrack(choices, toks1, toks2)
+    
+    def _encode_toks(self, toks1, toks2):
+        """Encode tokens as int kind codes and interned lowercase word ids"""
+        if isinstance(toks1, CbxTokenStream) and isinstance(toks2, CbxTokenStream) and toks1.vocab is toks2.vocab:
+            # Already encoded against a shared vocabulary
+            return toks1.kinds, toks1.ids, toks2.kinds, toks2.ids
+        vocab = {}
+        def encode(toks):
+            kinds = np.fromiter((t.kind for t in toks), dtype=np.int8, count=len(toks))
+            ids = np.fromiter((vocab.setdefault(t.lower, len(vocab)) for t in toks), dtype=np.int32, count=len(toks))
+            return kinds, ids
+        kinds1, ids1 = encode(toks1)
+        kinds2, ids2 = encode(toks2)
+        return kinds1, ids1, kinds2, ids2
+    
+    def _gap_costs(self, kinds):
+        """Vectorized _calculate_gap_cost"""
+        gaps = np.full(len(kinds), self._COST_WORD_MISMATCH, dtype=np.int32)
+        gaps[kinds == CbxToken.LINE_BREAK] = self._COST_LINE_BREAK
+        gaps[kinds == CbxToken.SECTION_HEADER] = 0
+        return gaps
+    
+    def _match_cost_matrix(self, kinds1, ids1, kinds2, ids2):
+        """Vectorized _calculate_match_cost for every (tok1, tok2) pair"""
+        k1 = kinds1[:, None]
+        k2 = kinds2[None, :]
+        sub = np.full((len(kinds1), len(kinds2)), self._COST_WORD_MISMATCH, dtype=np.int32)
+        # Apply rules from lowest to highest precedence so later ones win
+        apostrophe = ((k1 == CbxToken.WORD_WITH_APOSTROPHE) & (k2 == CbxToken.WORD)) | \
+                     ((k2 == CbxToken.WORD_WITH_APOSTROPHE) & (k1 == CbxToken.WORD))
+        sub[apostrophe] = self._COST_APOSTROPHE_MISMATCH
+        sub[(k1 == CbxToken.LINE_BREAK) | (k2 == CbxToken.LINE_BREAK)] = self._COST_LINE_BREAK
+        sub[ids1[:, None] == ids2[None, :]] = 0
+        sub[(k1 == CbxToken.SECTION_HEADER) | (k2 == CbxToken.SECTION_HEADER)] = 0
+        return sub
+    
+    def alignToksLinear(self, toks1, toks2, cumulative=False):
+        """Divide-and-conquer alignment in roughly O(n+m) memory.
+        
+        Rectangles of the DP are solved from their top-row/left-column costs. Each
+        rectangle is split at its middle row; a forward pass tracks where the
+        backtrack path crosses that row, so both halves reproduce exactly the
+        pairs _backtrack would return from the full matrix."""
+        n, m = len(toks1), len(toks2)
+        enc = self._encode_toks(toks1, toks2)
+        kinds1, ids1, kinds2, ids2 = enc
+        gap1 = self._gap_costs(kinds1).astype(np.int64)
+        gap2 = self._gap_costs(kinds2).astype(np.int64)
+        
+        # First row/column hold the single gap cost, as in alignToksPython
+        top = np.concatenate(([0], np.cumsum(gap2) if cumulative else gap2))
+        left = np.concatenate(([0], np.cumsum(gap1) if cumulative else gap1))
+        moves = []  # (x, y, choice) in backtrack order
+        x, y = self._solve_rect(enc, gap1, gap2, 0, 0, n, m, top, left, moves)
+        moves.extend((xx, 0, 1) for xx in range(x, 0, -1))
+        moves.extend((0, yy, 2) for yy in range(y, 0, -1))
+        
+        pairs = []
+        for x, y, choice in reversed(moves):
+            if choice == 0:
+                pairs.append((toks1[x-1], toks2[y-1]))
+            elif choice == 1:
+                pairs.append((toks1[x-1], None))
+            else:
+                pairs.append((None, toks2[y-1]))
+        return pairs
+    
+    def _dp_row(self, enc, gap1, gap2, gap2_cum, x, y0, y1, prev, left_val):
+        """Costs and choices of DP row x over columns y0..y1 from row x-1"""
+        kinds1, ids1, kinds2, ids2 = enc
+        sub = self._match_cost_matrix(kinds1[x-1:x], ids1[x-1:x], kinds2[y0:y1], ids2[y0:y1])[0]
+        cost_diag = prev[:-1] + sub
+        cost_left = prev[1:] + gap1[x-1]
+        # cur[j] = min(best[j], cur[j-1] + gap2[j]) is a running minimum once offset by the cumulative up cost
+        best = np.concatenate(([left_val], np.minimum(cost_diag, cost_left)))
+        cur = gap2_cum + np.minimum.accumulate(best - gap2_cum)
+        cost_up = cur[:-1] + gap2[y0:y1]
+        choice = np.where((cost_diag <= cost_left) & (cost_diag <= cost_up), 0, np.where(cost_left <= cost_up, 1, 2))
+        return cur, choice
+    
+    def _solve_rect(self, enc, gap1, gap2, x0, y0, x1, y1, top, left, moves):
+        """Backtrack from (x1, y1) until reaching row x0 or column y0; return the exit cell.
+        
+        top/left are the true DP costs along row x0 and column y0 of the rectangle."""
+        h, w = x1 - x0, y1 - y0
+        if h == 0 or w == 0:
+            return x1, y1
+        gap2_cum = np.concatenate(([0], np.cumsum(gap2[y0:y1])))
+        
+        if h <= 2 or h * w <= self._LINEAR_BLOCK_CELLS:
+            # Small enough to keep the choices of the whole rectangle
+            choices = np.zeros((h + 1, w + 1), dtype=np.int8)
+            prev = top
+            for i in range(1, h + 1):
+                prev, choices[i, 1:] = self._dp_row(enc, gap1, gap2, gap2_cum, x0 + i, y0, y1, prev, left[i])
+            i, j = h, w
+            while i > 0 and j > 0:
+                choice = choices[i, j]
+                moves.append((x0 + i, y0 + j, choice))
+                if choice == 0:
+                    i -= 1
+                    j -= 1
+                elif choice == 1:
+                    i -= 1
+                else:
+                    j -= 1
+            return x0 + i, y0 + j
+        
+        # Forward pass; below the middle row, track for every cell the column where
+        # its backtrack path first reaches the middle row (-1: leaves by column y0)
+        mid = x0 + h // 2
+        prev = top
+        cross = None
+        cols = np.arange(w + 1)
+        for x in range(x0 + 1, x1 + 1):
+            prev, choice = self._dp_row(enc, gap1, gap2, gap2_cum, x, y0, y1, prev, left[x - x0])
+            if x == mid:
+                mid_row = prev
+                cross = cols.copy()
+                cross[0] = -1
+            elif x > mid:
+                base = np.empty(w + 1, dtype=np.int64)
+                base[0] = -1
+                base[1:] = np.where(choice == 0, cross[:-1], cross[1:])
+                src = np.where(np.concatenate(([False], choice == 2)), 0, cols)
+                cross = base[np.maximum.accumulate(src)]
+        yc = int(cross[w])
+        
+        if yc < 0:
+            # Path leaves through column y0 below the middle row
+            return self._solve_rect(enc, gap1, gap2, mid, y0, x1, y1, mid_row, left[mid - x0:], moves)
+        
+        # Recompute the lower-left part to get the costs of column y0+yc below the middle row
+        col = np.empty(x1 - mid + 1, dtype=np.int64)
+        col[0] = mid_row[yc]
+        prev = mid_row[:yc + 1]
+        gap2_cum_left = gap2_cum[:yc + 1]
+        for x in range(mid + 1, x1 + 1):
+            prev, _ = self._dp_row(enc, gap1, gap2, gap2_cum_left, x, y0, y0 + yc, prev, left[x - x0])
+            col[x - mid] = prev[yc]
+        
+        ex, ey = self._solve_rect(enc, gap1, gap2, mid, y0 + yc, x1, y1, mid_row[yc:], col, moves)
+        # The path then walks up column y0+yc to the middle row
+        moves.extend((xx, ey, 1) for xx in range(ex, mid, -1))
+        return self._solve_rect(enc, gap1, gap2, x0, y0, mid, y0 + yc, top[:yc + 1], left[:mid - x0 + 1], moves)
+    
     def _calculate_match_cost(self, tok1, tok2):
         # Skip cost calculation for section headers
         if tok1.kind == CbxToken.SECTION_HEADER or tok2.kind == CbxToken.SECTION_HEADER:
             return 0
             
         # Exact match
-        if tok1.token.lower() == tok2.token.lower():
+        if tok1.lower == tok2.lower:
             return 0
             
         # Line break mismatch
@@ -176,4 +663,42 @@ Heart like boulders, world getting colder"""
         print("Aligned Result:")
         print(result)
 
+    def test_engines(self, text1, text2):
+        # Cross-check the python and numpy DP engines on the same input
+        toks1 = self.tokenizer.tokenize_lyrics(text1)
+        toks2 = self.tokenizer.tokenize_lyrics(text2)
+        def key(pairs):
+            return [(a and a.index, b and b.index) for a, b in pairs]
+        same = True
+        for cumulative in (False, True):
+            pairs_py = self.alignToksPython(toks1, toks2, cumulative)
+            same &= key(pairs_py) == key(self.alignToksNumpy(toks1, toks2, cumulative)) == \
+                    key(self.alignToksLinear(toks1, toks2, cumulative))
+        print(f"Engines agree: {same} ({len(pairs_py)} pairs)")
+        return same
+
+    def test_sections(self, text1, text2):
+        # Compare the section strategy with the whole-song DP on the same input
+        toks1 = self.tokenizer.tokenize_lyrics(text1)
+        toks2 = self.tokenizer.tokenize_lyrics(text2)
+        full = {b.index: a.index for a, b in self._alignFull(toks1, toks2) if a is not None and b is not None}
+        sections = {b.index: a.index for a, b in self.alignToksSections(toks1, toks2) if a is not None and b is not None}
+        agree = sum(full.get(y) == x for y, x in sections.items()) / max(len(full), 1)
+        print(f"Section pairs matching the full DP: {agree:.1%} ({len(sections)} vs {len(full)} matched tokens)")
+        return agree
+
+    def test_anchors(self, text1, text2):
+        # Compare the anchor strategy with the whole-song DP on the same input
+        toks1 = self.tokenizer.tokenize_lyrics(text1)
+        toks2 = self.tokenizer.tokenize_lyrics(text2)
+        pairs = self.alignToksAnchored(toks1, toks2)
+        # Every token of each stream appears exactly once, in order
+        assert [a.index for a, _ in pairs if a is not None] == list(range(len(toks1)))
+        assert [b.index for _, b in pairs if b is not None] == list(range(len(toks2)))
+        full = {b.index: a.index for a, b in self._alignFull(toks1, toks2) if a is not None and b is not None}
+        anchored = {b.index: a.index for a, b in pairs if a is not None and b is not None}
+        agree = sum(full.get(y) == x for y, x in anchored.items()) / max(len(full), 1)
+        print(f"Anchored pairs matching the full DP: {agree:.1%} ({len(anchored)} vs {len(full)} matched tokens)")
+        return agree
+
 # CbxAligner().test_lyrics()
@@ -7,6 +7,22 @@ Created on Sun May 26 10:43:12 2024
 """
 
 import re
+import numpy as np
+
+# All token kinds in one pass, in priority order. Each alternative ends with
+# \n?\Z, which is what ^...$ accepted before (a trailing newline is allowed).
+_KIND_PATTERN = re.compile(r"""
+    (?P<section>\[.*\]\n?\Z)                  # section headers like [Verse]
+  | (?P<linebreak>\n\Z)                        # line breaks
+  | (?P<apostrophe>(?=[\w']*')[\w']+\n?\Z)     # words with apostrophes (like gettin', ain't)
+  | (?P<tag><[^<>]*>\n?\Z)
+  | (?P<word>\w+\n?\Z)
+  | (?P<punct>[^\w]\n?\Z)
+""", re.VERBOSE)
+
+# Lyric line tokens: words (apostrophes included) and single punctuation marks
+_LINE_TOKEN_PATTERN = re.compile(r"(?P<word>[\w']+)|(?P<punct>[^\w\s])")
+_XML_TOKEN_PATTERN = re.compile(r'<[^<>]*>|\w+|&[a-zA-Z]+;|&#[0-9]+;|[^\w]')
 
 class CbxToken:
     UNK = 0
@@ -17,28 +33,20 @@ class CbxToken:
     SECTION_HEADER = 5
     WORD_WITH_APOSTROPHE = 6
 
-    def __init__(self, token, index):
-        # Handle section headers first
-        if re.match(r'^\[.*\]$', token):
-            self.kind = self.SECTION_HEADER
-        # Handle line breaks
-        elif token == '\n':
-            self.kind = self.LINE_BREAK
-        # Handle words with apostrophes (like gettin', ain't)
-        elif re.match(r"^[\w']+$", token) and "'" in token:
-            self.kind = self.WORD_WITH_APOSTROPHE
-        # Original token types
-        elif re.match(r'^<[^<>]*>$', token):
-            self.kind = self.TAG
-        elif re.match(r'^\w+$', token):
-            self.kind = self.WORD
-        elif re.match(r'^[^\w]$', token):
-            self.kind = self.PUNCT
-        else:
-            self.kind = self.UNK
-        
+    __slots__ = ('token', 'index', 'kind', 'lower')
+
+    def __init__(self, token, index, kind=None):
         self.token = token
         self.index = index
+        self.kind = self.classify(token) if kind is None else kind
+        self.lower = token.lower()
+
+    @classmethod
+    def classify(cls, token):
+        m = _KIND_PATTERN.match(token)
+        if m is None:
+            return cls.UNK
+        return _GROUP_KINDS[m.lastgroup]
         
     def __repr__(self):
         return f"CbxToken(token={self.token}, kind={self.kind})"
@@ -46,42 +54,123 @@ class CbxToken:
     def __str__(self):
         return repr(self)
 
+_GROUP_KINDS = {
+    "section": CbxToken.SECTION_HEADER,
+    "linebreak": CbxToken.LINE_BREAK,
+    "apostrophe": CbxToken.WORD_WITH_APOSTROPHE,
+    "tag": CbxToken.TAG,
+    "word": CbxToken.WORD,
+    "punct": CbxToken.PUNCT,
+}
+
+class CbxVocab:
+    """Interned lowercase word forms shared by several token streams"""
+    
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+    
+    def intern(self, lower):
+        word_id = self.ids.get(lower)
+        if word_id is None:
+            word_id = self.ids[lower] = len(self.words)
+            self.words.append(lower)
+        return word_id
+    
+    def __len__(self):
+        return len(self.words)
+
+class CbxTokenStream:
+    """Compact token list: parallel arrays of word ids, kinds and source offsets.
+    
+    CbxToken objects are only built (and cached) when indexed."""
+    
+    def __init__(self, text, vocab, ids, kinds, starts, ends):
+        self.text = text
+        self.vocab = vocab
+        self.ids = ids  # int32 ids into vocab
+        self.kinds = kinds  # int8 CbxToken kinds
+        self.starts = starts  # int32 source offsets
+        self.ends = ends
+        self._tokens = [None] * len(ids)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        tok = self._tokens[i]
+        if tok is None:
+            kind = int(self.kinds[i])
+            text = '\n' if kind == CbxToken.LINE_BREAK else self.text[self.starts[i]:self.ends[i]]
+            tok = self._tokens[i] = CbxToken(text, i if i >= 0 else len(self) + i, kind)
+        return tok
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def tokens(self):
+        """Materialize the CbxToken list"""
+        return list(self)
+
 class CbxTokenizer:
-    def tokenize_lyrics(self, text):
+    def _iter_lyrics(self, text):
+        """Yield (token, kind, start, end) for each lyric token, with source offsets"""
+        pos = 0
         # Split into lines first to preserve line structure
-        lines = text.split('\n')
-        tokens = []
-        index = 0
-        
-        for line in lines:
-            line = line.strip()
+        for raw_line in text.split('\n'):
+            line_start = pos
+            pos += len(raw_line) + 1
+            line = raw_line.strip()
             if not line:
                 continue
+            offset = line_start + len(raw_line) - len(raw_line.lstrip())
                 
             # Handle section headers as a single token
-            if re.match(r'^\[.*\]$', line):
-                tokens.append(CbxToken(line, index))
-                index += 1
+            if len(line) >= 2 and line[0] == '[' and line[-1] == ']':
+                yield line, CbxToken.SECTION_HEADER, offset, offset + len(line)
                 continue
             
-            # Tokenize the line
-            line_tokens = re.findall(r"[\w']+|[^\w\s]|\s+", line)
-            
-            # Process tokens in the line
-            for token in line_tokens:
-                if token.strip():  # Skip pure whitespace
-                    tokens.append(CbxToken(token, index))
-                    index += 1
+            # Tokenize and classify the line in one pass (whitespace is skipped)
+            for m in _LINE_TOKEN_PATTERN.finditer(line):
+                token = m.group()
+                if m.lastgroup == "punct":
+                    kind = CbxToken.PUNCT
+                elif "'" in token:
+                    kind = CbxToken.WORD_WITH_APOSTROPHE
+                else:
+                    kind = CbxToken.WORD
+                yield token, kind, offset + m.start(), offset + m.end()
             
             # Add line break token
-            tokens.append(CbxToken('\n', index))
-            index += 1
-        
-        return tokens
+            end = line_start + len(raw_line)
+            yield '\n', CbxToken.LINE_BREAK, end, end
+    
+    def tokenize_lyrics(self, text):
+        return [CbxToken(token, index, kind) for index, (token, kind, _, _) in enumerate(self._iter_lyrics(text))]
+    
+    def tokenize_lyrics_compact(self, text, vocab=None):
+        """Like tokenize_lyrics, but returns a CbxTokenStream over a (shared) CbxVocab"""
+        vocab = vocab if vocab is not None else CbxVocab()
+        ids, kinds, starts, ends = [], [], [], []
+        for token, kind, start, end in self._iter_lyrics(text):
+            ids.append(vocab.intern(token.lower()))
+            kinds.append(kind)
+            starts.append(start)
+            ends.append(end)
+        return CbxTokenStream(
+            text, vocab,
+            np.array(ids, dtype=np.int32),
+            np.array(kinds, dtype=np.int8),
+            np.array(starts, dtype=np.int32),
+            np.array(ends, dtype=np.int32),
+        )
 
     def tokenize_xml(self, text):
         # Keep original XML tokenization for backward compatibility
-        tokens = re.findall(r'<[^<>]*>|\w+|&[a-zA-Z]+;|&#[0-9]+;|[^\w]', text)
+        tokens = _XML_TOKEN_PATTERN.findall(text)
         return [CbxToken(token, t) for t, token in enumerate(tokens) if token]
 
     def test_lyrics(self):
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory subtitle cues passed between transcription, SrtSync and LRC conversion
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SrtCue:
+    __slots__ = ('index', 'start', 'end', 'text')
+
+    def __init__(self, index, start, end, text):
+        self.index = index  # 1-based block number
+        self.start = start  # milliseconds
+        self.end = end  # milliseconds
+        self.text = text  # lines joined with '\n'
+
+    def timestamp(self):
+        """SRT timing line, e.g. 00:00:04,460 --> 00:00:07,180"""
+        return f"{format_timestamp(self.start)} --> {format_timestamp(self.end)}"
+
+    def __repr__(self):
+        return f"SrtCue(index={self.index}, start={self.start}, end={self.end}, text={self.text!r})"
+
+def format_timestamp(ms):
+    """Format milliseconds as HH:MM:SS,mmm"""
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+def parse_timestamp(stamp):
+    """Parse HH:MM:SS,mmm (or HH:MM:SS.mmm) into milliseconds"""
+    hms, _, frac = stamp.strip().replace('.', ',').partition(',')
+    parts = [int(p) for p in hms.split(':')]
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    h, m, s = parts[-3:]
+    ms = int((frac + '000')[:3]) if frac else 0
+    return ((h * 60 + m) * 60 + s) * 1000 + ms
+
+def parse_timing_line(line):
+    """Parse 'start --> end' into (start_ms, end_ms)"""
+    start, _, end = line.partition('-->')
+    return parse_timestamp(start), parse_timestamp(end)
+
+def iter_srt(lines):
+    """Parse SRT lines lazily, yielding one SrtCue per block.
+    
+    Blocks are separated by blank lines. The timing line is the first line
+    containing '-->', the block number is the digit line before it (None if
+    missing) and the text is every line after it. Blocks without a valid
+    timing line are skipped."""
+    block = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line.strip():
+            block.append(line)
+            continue
+        if block:
+            cue = _block_to_cue(block)
+            if cue is not None:
+                yield cue
+            block = []
+    if block:
+        cue = _block_to_cue(block)
+        if cue is not None:
+            yield cue
+
+def _block_to_cue(block):
+    timing = next((i for i, line in enumerate(block) if '-->' in line), None)
+    if timing is None:
+        return None
+    try:
+        start, end = parse_timing_line(block[timing])
+    except ValueError:
+        logger.warning(f"Skipping SRT block with bad timing line: {block[timing]}")
+        return None
+    number = block[timing - 1].strip() if timing > 0 else ""
+    index = int(number) if number.isdigit() else None
+    return SrtCue(index, start, end, '\n'.join(block[timing + 1:]))
+
+def parse_srt(text):
+    """Parse SRT text into cues (a generator)"""
+    return iter_srt(text.split('\n'))
+
+def iter_srt_file(path):
+    """Parse an SRT file lazily, one line at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_srt(f)
+
+def cues_from_segments(segments):
+    """Convert Whisper segments (seconds) into cues numbered like whisper's WriteSRT"""
+    return [
+        SrtCue(i, round(seg["start"] * 1000.0), round(seg["end"] * 1000.0), seg["text"].strip().replace("-->", "->"))
+        for i, seg in enumerate(segments, start=1)
+    ]
+
+def cues_to_srt(cues):
+    """Render cues as SRT text"""
+    return ''.join(f"{cue.index}\n{cue.timestamp()}\n{cue.text}\n\n" for cue in cues)
+
+def write_srt(cues, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(cues_to_srt(cues))
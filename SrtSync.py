@@ -7,38 +7,114 @@ Created on Tue May 28 11:19:48 2024
 """
 import argparse
 import re
+import numpy as np
 from CbxAligner import CbxAligner
+from SrtCue import SrtCue, parse_srt, cues_to_srt
+from metrics import time_stage
+
+class LineIndex:
+    """Inverted index of the lyrics lines by character, built once per song.
+    
+    Scores transcribed lines exactly like SrtSync.get_line_similarity, but only
+    against candidate lines taken from the posting lists: a line can only pass a
+    Jaccard threshold t if it shares one of the query's rarest len - floor(t * len) + 1
+    characters and its size is within a factor t of the query's (prefix and size
+    filtering); substring matches need the query's rarest characters in the line,
+    or the line's rarest character in the query."""
+    
+    def __init__(self, lines):
+        self.lines = [line.lower().strip() for line in lines]
+        char_sets = [set(line) for line in self.lines]
+        self.sizes = np.array([len(chars) for chars in char_sets], dtype=np.float64)
+        # Character -> column of the signature matrix, and -> ids of the lines containing it
+        self.alphabet = {}
+        postings = {}
+        for i, chars in enumerate(char_sets):
+            for ch in chars:
+                self.alphabet.setdefault(ch, len(self.alphabet))
+                postings.setdefault(ch, []).append(i)
+        self.postings = {ch: np.array(ids, dtype=np.int64) for ch, ids in postings.items()}
+        # Lines by their rarest character, for lines that may be substrings of a query
+        self.by_rarest = {}
+        for i, chars in enumerate(char_sets):
+            if chars:
+                self.by_rarest.setdefault(min(chars, key=self._rarity), []).append(i)
+        self.signatures = np.zeros((len(self.lines), len(self.alphabet)), dtype=np.float64)
+        for row, chars in enumerate(char_sets):
+            self.signatures[row, [self.alphabet[ch] for ch in chars]] = 1.0
+    
+    def _rarity(self, ch):
+        postings = self.postings.get(ch)
+        return (0 if postings is None else len(postings), ch)
+    
+    def candidates(self, query, threshold):
+        """Sorted ids of the lines that may score above threshold against a lowercased, stripped query"""
+        chars = sorted(set(query), key=self._rarity)
+        if not chars:
+            return np.zeros(0, dtype=np.int64)
+        n = len(chars)
+        empty = np.zeros(0, dtype=np.int64)
+        # Jaccard: shares a prefix character, and size within [t * n, n / t]
+        jaccard = np.unique(np.concatenate([self.postings.get(ch, empty) for ch in chars[:n - int(threshold * n) + 1]]))
+        sizes = self.sizes[jaccard]
+        jaccard = jaccard[(sizes >= threshold * n - 1e-9) & (sizes * threshold <= n + 1e-9)]
+        # Substrings: query in line (the line has the query's rarest characters), or line in query
+        contains = self.postings.get(chars[0], empty)
+        for ch in chars[1:3]:
+            contains = np.intersect1d(contains, self.postings.get(ch, empty), assume_unique=True)
+        within = np.array([i for ch in chars for i in self.by_rarest.get(ch, ()) if self.sizes[i] <= n], dtype=np.int64)
+        return np.unique(np.concatenate([jaccard, contains, within]))
+    
+    def scores(self, query, ids):
+        """get_line_similarity(query, line) for the given line ids (query lowercased and stripped)"""
+        chars = set(query)
+        q_sig = np.zeros(len(self.alphabet), dtype=np.float64)
+        q_sig[[self.alphabet[ch] for ch in chars if ch in self.alphabet]] = 1.0
+        inter = self.signatures[ids] @ q_sig
+        sizes = self.sizes[ids]
+        union = len(chars) + sizes - inter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sims = np.where(union > 0, inter / union, 0.0)
+        
+        # A substring's characters are a subset of the other line's, so only
+        # pairs with a subset relation need the actual substring test
+        for k in np.flatnonzero((inter == len(chars)) | (inter == sizes)):
+            line = self.lines[ids[k]]
+            if query and line and (query in line or line in query):
+                sims[k] = 0.9  # High confidence for substring matches
+        sims[sizes == 0] = 0.0
+        return sims
+    
+    def best_matches(self, queries, threshold):
+        """(index, score) of the first best lyrics line scoring above threshold, or (-1, 0) per query"""
+        matches = []
+        for query in queries:
+            query = query.lower().strip()
+            ids = self.candidates(query, threshold)
+            if len(ids) == 0:
+                matches.append((-1, 0))
+                continue
+            sims = self.scores(query, ids)
+            sims[sims <= threshold] = 0.0
+            best = int(np.argmax(sims))  # Candidates are sorted: first index among equal maxima, as in the pairwise loop
+            matches.append((int(ids[best]), float(sims[best])) if sims[best] > 0 else (-1, 0))
+        return matches
 
 class SrtSync:
     def __init__(self):
         self.aligner = CbxAligner()
         
     def toXml(self,srt):
-        # Split into blocks first
-        blocks = []
-        current_block = []
-        
-        for line in srt.split('\n'):
-            if line.strip():
-                current_block.append(line)
-            elif current_block:
-                blocks.append(current_block)
-                current_block = []
-        if current_block:
-            blocks.append(current_block)
-            
-        # Convert blocks to XML
+        """SRT text (or already parsed cues) as <time block=".." stamp=".."/>text lines"""
+        cues = parse_srt(srt) if isinstance(srt, str) else srt
         xml_blocks = []
-        for block in blocks:
-            if len(block) >= 3:  # Valid SRT block should have at least 3 lines
-                block_num = block[0].strip()
-                if block_num.isdigit():
-                    timestamp = block[1].strip()
-                    text = ' '.join(block[2:]).strip()
-                    # Escape XML special characters in text only
-                    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    xml_block = f'<time block="{block_num}" stamp="{timestamp}"/>{text}'
-                    xml_blocks.append(xml_block)
+        for cue in cues:
+            if cue.index is None or not cue.text:  # Valid SRT block has a number, a timing line and text
+                continue
+            text = ' '.join(cue.text.split('\n')).strip()
+            # Escape XML special characters in text only
+            text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            xml_blocks.append(f'<time block="{cue.index}" stamp="{cue.timestamp()}"/>{text}')
         
         return '\n'.join(xml_blocks)
         
@@ -82,109 +158,108 @@ class SrtSync:
             self.txt = f.read()
         print(f"TXT content preview:\n{self.txt[:500]}")
         
-        # Parse original SRT timestamps with block numbers
-        timestamps = {}  # Changed to dict to store block -> timestamp mapping
-        srt_lines = {}  # Store original transcribed lines
-        current_block = None
-        current_text = None
-        
-        for line in self.srt.split('\n'):
-            line = line.strip()
-            if line.isdigit():
-                current_block = int(line)
-                current_text = None
-            elif '-->' in line and current_block is not None:
-                timestamps[current_block] = line
-                print(f"Stored timestamp for block {current_block}: {line}")
-            elif line and current_block is not None and '-->' not in line:
-                if current_text is None:
-                    current_text = line
-                else:
-                    current_text += " " + line
-                srt_lines[current_block] = current_text
-        
-        print(f"Found {len(timestamps)} timestamps")
+        # Parse the SRT once; numbered blocks only, a repeated number keeps the last block
+        parsed = [cue for cue in parse_srt(self.srt) if cue.index is not None]
+        cues = {}  # block -> SrtCue
+        for cue in parsed:
+            cues[cue.index] = SrtCue(cue.index, cue.start, cue.end, ' '.join(l.strip() for l in cue.text.split('\n') if l.strip()))
         
         # Convert SRT to XML while preserving timestamps
         print("Converting SRT to XML...")
-        self.xml = self.toXml(self.srt)
+        self.xml = self.toXml(parsed)
         print(f"XML content preview:\n{self.xml[:500]}")
         
-        # Split the lyrics text into lines, removing section headers and empty lines
+        synced = self.sync_cues(list(cues.values()), self.txt)
+        self.synced = cues_to_srt(synced)[:-1]  # No blank line after the last block
+        
+        # Write output
+        output_path = self.pathTxt+".srt"
+        print(f"Writing to: {output_path}")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(self.synced)
+        print("Write complete")
+        
+    def sync_cues(self, cues, txt):
+        """Retime the lyrics text using transcribed cues; returns the synced cues"""
+        with time_stage("sync"):
+            return self._sync_cues(cues, txt)
+        
+    def preview_cues(self, cues, txt):
+        """First-pass synced cues for the transcribed cues received so far.
+        
+        Lines only depend on earlier blocks, so they stay valid as more cues arrive;
+        repeated lines are only placed by sync_cues once the transcript is complete."""
+        timestamps = {cue.index: cue for cue in cues}
+        srt_lines = {cue.index: cue.text for cue in cues if cue.text}
+        if 1 not in timestamps:
+            return []
+        output, _ = self._first_pass(timestamps, self._lyrics_lines(txt), self._start_block(srt_lines), verbose=False)
+        return output
+    
+    def _lyrics_lines(self, txt):
+        """Split the lyrics text into lines, removing section headers and empty lines"""
         lyrics_lines = []
-        for line in self.txt.split('\n'):
+        for line in txt.split('\n'):
             line = line.strip()
             if line and not (line.startswith('[') and line.endswith(']')):
                 lyrics_lines.append(line)
-        
-        # Create output SRT blocks
-        output_lines = []
-        counter = 1
-        processed_blocks = set()  # Track which blocks we've processed
-        
-        # Skip the first block if it's an intro/adlib
-        start_block = 1
+        return lyrics_lines
+    
+    def _start_block(self, srt_lines):
+        """Skip the first block if it's an intro/adlib"""
         if 1 in srt_lines and "yeah" in srt_lines[1].lower():
-            start_block = 2
-        
-        # First pass: direct matching of lyrics lines
+            return 2
+        return 1
+    
+    def _first_pass(self, timestamps, lyrics_lines, start_block, verbose=True):
+        """Give the n-th lyrics line the timing of the n-th transcribed block; returns (cues, blocks used)"""
+        output = []
+        processed_blocks = set()  # Track which blocks we've processed
         lyrics_index = 0
         for block_num in range(start_block, len(lyrics_lines) + start_block):
             if block_num in timestamps and lyrics_index < len(lyrics_lines):
-                output_lines.extend([
-                    str(counter),
-                    timestamps[block_num],
-                    lyrics_lines[lyrics_index],
-                    ''
-                ])
+                cue = timestamps[block_num]
+                output.append(SrtCue(len(output) + 1, cue.start, cue.end, lyrics_lines[lyrics_index]))
                 processed_blocks.add(block_num)
-                print(f"Added block {counter} with timestamp: {timestamps[block_num]} and text: {lyrics_lines[lyrics_index]}")
-                counter += 1
+                if verbose:
+                    print(f"Added block {len(output)} with timestamp: {cue.timestamp()} and text: {lyrics_lines[lyrics_index]}")
                 lyrics_index += 1
+        return output, processed_blocks
+        
+    def _sync_cues(self, cues, txt):
+        timestamps = {cue.index: cue for cue in cues}  # block -> cue with the timing
+        srt_lines = {cue.index: cue.text for cue in cues if cue.text}  # Store original transcribed lines
+        print(f"Found {len(timestamps)} timestamps")
+        if not timestamps:
+            return []
+        
+        lyrics_lines = self._lyrics_lines(txt)
+        start_block = self._start_block(srt_lines)
+        
+        # First pass: direct matching of lyrics lines
+        output, processed_blocks = self._first_pass(timestamps, lyrics_lines, start_block)
+        counter = len(output) + 1
         
         # Second pass: check remaining transcribed lines for similarity with any lyrics line
         SIMILARITY_THRESHOLD = 0.7  # Adjust this threshold as needed
         
-        for block_num in range(start_block, max(timestamps.keys()) + 1):
-            # Skip blocks we've already processed
-            if block_num in processed_blocks:
-                continue
-                
-            if block_num in srt_lines and block_num in timestamps:  # Extra line
-                transcribed_line = srt_lines[block_num]
-                
-                # Find best matching lyrics line
-                best_match = None
-                best_score = 0
-                best_index = -1
-                
-                for i, lyrics_line in enumerate(lyrics_lines):
-                    similarity = self.get_line_similarity(transcribed_line, lyrics_line)
-                    if similarity > SIMILARITY_THRESHOLD and similarity > best_score:
-                        best_score = similarity
-                        best_match = lyrics_line
-                        best_index = i
-                
-                if best_match:  # Only add if we found a match
-                    output_lines.extend([
-                        str(counter),
-                        timestamps[block_num],  # Use the actual timestamp from transcription
-                        best_match,  # Use the matching lyrics line instead of transcribed line
-                        ''
-                    ])
-                    processed_blocks.add(block_num)
-                    print(f"Added repeated line {counter} with timestamp: {timestamps[block_num]} and text: {best_match} (similarity: {best_score:.2f})")
-                    counter += 1
-        
-        self.synced = '\n'.join(output_lines)
-        print(f"\nFinal SRT content:\n{self.synced}")
+        # Extra lines, scored against all lyrics lines at once
+        extra_blocks = [block_num for block_num in range(start_block, max(timestamps.keys()) + 1)
+                        if block_num not in processed_blocks and block_num in srt_lines and block_num in timestamps]
+        matches = LineIndex(lyrics_lines).best_matches([srt_lines[b] for b in extra_blocks], SIMILARITY_THRESHOLD)
         
-        # Write output
-        output_path = self.pathTxt+".srt"
-        print(f"Writing to: {output_path}")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(self.synced)
-        print("Write complete")
+        for block_num, (best_index, best_score) in zip(extra_blocks, matches):
+            if best_index >= 0:  # Only add if we found a match
+                # Use the actual timestamp from transcription and the matching lyrics line
+                best_match = lyrics_lines[best_index]
+                cue = timestamps[block_num]
+                output.append(SrtCue(counter, cue.start, cue.end, best_match))
+                processed_blocks.add(block_num)
+                print(f"Added repeated line {counter} with timestamp: {cue.timestamp()} and text: {best_match} (similarity: {best_score:.2f})")
+                counter += 1
+        
+        print(f"\nFinal SRT content:\n{cues_to_srt(output)}")
+        return output
         
     def test(self):
         self.sync("./data/KatyPerry-Firework.mp3.srt", "./data/KatyPerry-Firework.txt")
@@ -1,6 +1,20 @@
+import asyncio
+import json
+import os
+import time
+from typing import List, Optional
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, HttpUrl
-from process import process_audio
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, HttpUrl, field_validator
+from process import process_audio, resync, create_pipeline, new_context, STAGES
+from model_registry import registry, replicas
+from jobs import JobManager, Job, QueueFull
+from transcript_cache import get_cache
+from audio_cache import get_audio_cache
+from chunking import shutdown_pool
+from warmup import Warmup
+from transcribers import TRANSCRIBERS
+import metrics
 import logging
 
 # Configure logging
@@ -8,19 +22,149 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="LRC Sync API")
+jobs = JobManager()
+# Overlapped download/decode/transcribe/sync stages used by batch requests
+pipeline = create_pipeline()
+# Model warm-up run at startup; /readyz reports it
+warmup = Warmup()
+
+def _cache_counts():
+    cache = get_cache()
+    stats = cache.stats() if cache is not None else {"hits": 0, "misses": 0}
+    model_stats = registry.stats()
+    audio_cache = get_audio_cache()
+    audio_stats = audio_cache.stats() if audio_cache is not None else {"hits": 0, "misses": 0}
+    return {
+        ("transcript", "hit"): stats["hits"],
+        ("transcript", "miss"): stats["misses"],
+        ("audio", "hit"): audio_stats["hits"],
+        ("audio", "miss"): audio_stats["misses"],
+        ("model", "hit"): model_stats["hits"],
+        ("model", "miss"): model_stats["misses"],
+    }
+
+def _queue_depths():
+    depths = {("jobs",): jobs.queued()}
+    for stage, info in pipeline.stats().items():
+        depths[(f"pipeline_{stage}",)] = info["queue_depth"]
+    return depths
+
+metrics.register_callback_counter("lrc_sync_cache_requests_total", "Transcript, decoded audio and model cache lookups",
+                                  _cache_counts, ("cache", "result"))
+metrics.register_gauge("lrc_sync_queue_depth", "Songs waiting in each queue", _queue_depths, ("queue",))
+metrics.register_gauge("lrc_sync_jobs_in_flight", "Jobs currently running", lambda: jobs.counts()[Job.RUNNING])
+metrics.register_gauge("lrc_sync_model_replicas", "Whisper model replicas by state",
+                       lambda: {(model, state): info[state] for model, info in replicas.stats().items()
+                                for state in ("loaded", "busy", "capacity", "waiting")}, ("model", "state"))
+
+# How often event streams check their job for changes, in seconds
+EVENT_POLL_SECONDS = float(os.environ.get("LRC_SYNC_EVENT_POLL_SECONDS", "0.25"))
+
+# Largest playlist accepted by /process/batch (PRD targets 200 songs per batch)
+MAX_BATCH_ITEMS = int(os.environ.get("LRC_SYNC_MAX_BATCH_ITEMS", "200"))
 
 class ProcessRequest(BaseModel):
     audio_url: HttpUrl
     lyrics: str
+    engine: Optional[str] = None  # transcription engine; defaults to LRC_SYNC_TRANSCRIBER
+
+    @field_validator("engine")
+    @classmethod
+    def known_engine(cls, engine):
+        if engine is not None and engine not in TRANSCRIBERS:
+            raise ValueError(f"unknown engine {engine!r}, expected one of: {', '.join(TRANSCRIBERS)}")
+        return engine
+
+class ResyncRequest(BaseModel):
+    transcript_id: str
+    lyrics: str
+
+class BatchRequest(BaseModel):
+    items: List[ProcessRequest]
+    timeout: Optional[float] = None  # seconds; unfinished items are reported with their job id
+
+def submit_process_job(request: ProcessRequest) -> Job:
+    logger.info(f"Queueing job for audio URL: {request.audio_url}")
+    return jobs.submit(process_audio, str(request.audio_url), request.lyrics, stages=STAGES, engine=request.engine)
+
+def submit_pipeline_job(request: ProcessRequest) -> Job:
+    job = jobs.create(STAGES)
+    ctx = new_context(str(request.audio_url), request.lyrics, progress=job.update_stage, engine=request.engine)
+    return jobs.attach(job, pipeline.submit(ctx), result=lambda ctx: ctx["result"])
+
+@app.exception_handler(QueueFull)
+async def queue_full(request, exc: QueueFull):
+    """Backpressure: tell clients when to come back instead of queueing without bound"""
+    logger.warning(f"Rejecting request: {exc}")
+    return JSONResponse(status_code=429, content={"detail": str(exc), "retry_after": exc.retry_after},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: ProcessRequest):
+    """Queue audio URL and lyrics for processing and return the job id immediately"""
+    job = submit_process_job(request)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return job status, per-stage progress and the LRC result once done"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job.to_dict()
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def job_events(job: Job):
+    """Server-Sent Events for a job: stage transitions and progress, newly aligned LRC lines,
+    then the final done/failed job status"""
+    sent_stages = {}
+    sent_lines = 0
+    while True:
+        finished = job.status in (Job.DONE, Job.FAILED)  # Read first so no update is missed
+        for stage, info in list(job.stages.items()):
+            state = (info["status"], info["progress"])
+            if sent_stages.get(stage) != state:
+                sent_stages[stage] = state
+                yield _sse("stage", {"job_id": job.id, "stage": stage, "status": state[0], "progress": state[1]})
+        partial = job.partial or []
+        if len(partial) > sent_lines:
+            # Partial lines only ever grow, so send the new ones
+            yield _sse("lines", {"job_id": job.id, "lines": partial[sent_lines:]})
+            sent_lines = len(partial)
+        if finished:
+            yield _sse(job.status, job.to_dict())
+            return
+        await asyncio.sleep(EVENT_POLL_SECONDS)
+
+def _event_stream(job: Job) -> StreamingResponse:
+    return StreamingResponse(job_events(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Stream a job's progress and partial LRC lines as Server-Sent Events"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return _event_stream(job)
+
+@app.post("/process/stream")
+async def process_stream(request: ProcessRequest):
+    """Like /process, but streams progress, partial LRC lines and the result as Server-Sent Events"""
+    logger.info(f"Streaming request for audio URL: {request.audio_url}")
+    return _event_stream(submit_process_job(request))
 
 @app.post("/process")
 async def process(request: ProcessRequest):
     """Process audio URL and lyrics to generate synchronized LRC"""
+    logger.info(f"Processing request for audio URL: {request.audio_url}")
+    job = submit_process_job(request)  # QueueFull becomes a 429
     try:
-        logger.info(f"Processing request for audio URL: {request.audio_url}")
-        result = process_audio(str(request.audio_url), request.lyrics)
+        result = await asyncio.wrap_future(job.future)
         logger.info("Successfully processed audio")
-        return result
+        return dict(result, queue_seconds=job.queue_seconds)
     except FileNotFoundError as e:
         logger.error(f"File not found error: {str(e)}")
         raise HTTPException(status_code=404, detail=str(e))
@@ -35,6 +179,95 @@ async def process(request: ProcessRequest):
             }
         )
 
+@app.post("/resync")
+def resync_lyrics(request: ResyncRequest):
+    """Re-align new lyrics against the stored transcript of an earlier /process call"""
+    try:
+        return resync(request.transcript_id, request.lyrics)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=f"{e}; run /process again to re-transcribe")
+
+@app.post("/process/batch")
+async def process_batch(request: BatchRequest):
+    """Process a list of songs concurrently and return per-item results or errors"""
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has {len(request.items)} items, limit is {MAX_BATCH_ITEMS}")
+    
+    # Same LRC_SYNC_MAX_QUEUED budget as single jobs, applied to songs waiting for the
+    # pipeline; an admitted batch may go over it by its own size
+    jobs.admit(pipeline.waiting())  # QueueFull becomes a 429
+    
+    start_time = time.time()
+    logger.info(f"Processing batch of {len(request.items)} songs")
+    # Items flow through the staged pipeline, whose bounded queues between stages
+    # let the next songs download and decode while the current one is transcribed
+    batch_jobs = [submit_pipeline_job(item) for item in request.items]
+    futures = [asyncio.wrap_future(job.future) for job in batch_jobs]
+    if futures:
+        await asyncio.wait(futures, timeout=request.timeout)
+    
+    items = []
+    for index, (job, future) in enumerate(zip(batch_jobs, futures)):
+        item = {"index": index, "job_id": job.id, "audio_url": str(request.items[index].audio_url)}
+        if not future.done():
+            item["status"] = "timeout"
+        elif future.exception() is not None:
+            item["status"] = Job.FAILED
+            item["error"] = job.error
+        else:
+            item["status"] = Job.DONE
+            item["result"] = job.result
+        if job.started_at is not None and job.finished_at is not None:
+            item["seconds"] = round(job.finished_at - job.started_at, 3)
+        items.append(item)
+    
+    failed = sum(1 for item in items if item["status"] != Job.DONE)
+    logger.info(f"Batch finished: {len(items) - failed} succeeded, {failed} failed or timed out")
+    return {
+        "items": items,
+        "succeeded": len(items) - failed,
+        "failed": failed,
+        "seconds": round(time.time() - start_time, 3),
+        "stages": pipeline.stats(),
+    }
+
+@app.get("/pipeline")
+async def pipeline_stats():
+    """Report per-stage utilization of the batch pipeline"""
+    return pipeline.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Per-stage latency histograms and counters in Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/models")
+async def models():
+    """Report model registry hit/miss and load-time counters, and replica occupancy"""
+    return dict(registry.stats(), replicas=replicas.stats())
+
+@app.on_event("startup")
+def start_warmup():
+    # In the background, so /healthz answers while models load
+    warmup.start()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are warm (503 while warming up or if warm-up failed)"""
+    status = {"ready": warmup.ready, "warmup": warmup.to_dict(), "queued": jobs.counts()[Job.QUEUED]}
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=status)
+
+@app.on_event("shutdown")
+def shutdown():
+    jobs.shutdown(wait=False)
+    pipeline.shutdown()
+    shutdown_pool()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000) 
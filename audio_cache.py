@@ -0,0 +1,51 @@
+import os
+import logging
+import numpy as np
+from transcript_cache import TranscriptCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("LRC_SYNC_AUDIO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "lrc-sync", "audio"))
+DEFAULT_MAX_MB = int(os.environ.get("LRC_SYNC_AUDIO_CACHE_MB", "4096"))
+
+def audio_key(audio_hash: str, decoder: str) -> str:
+    """Key for the decoded 16 kHz mono waveform of the given audio, per decoder (ffmpeg, PyAV, ...)"""
+    return f"{audio_hash}.{decoder}"
+
+class AudioCache(TranscriptCache):
+    """On-disk cache of decoded waveforms as float32 .npy files, opened memory-mapped.
+
+    Workers reading the same song share the page cache instead of each
+    decoding and holding a private copy."""
+    suffix = ".npy"
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_mb: int = DEFAULT_MAX_MB):
+        super().__init__(directory, max_mb)
+
+    def get(self, key: str):
+        """Return the cached waveform as a read-only memory map, or None"""
+        path = self._path(key)
+        try:
+            audio = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+        self._hit(path)
+        return audio
+
+    def put(self, key: str, audio):
+        """Atomically store a waveform and return it memory-mapped from the cache"""
+        self._write(key, lambda f: np.save(f, np.asarray(audio, dtype=np.float32)))
+        mapped = np.load(self._path(key), mmap_mode='r')
+        self.evict()
+        return mapped
+
+_cache = None
+
+def get_audio_cache():
+    """Shared cache instance, or None when disabled with LRC_SYNC_AUDIO_CACHE_MB=0"""
+    global _cache
+    if _cache is None and DEFAULT_MAX_MB > 0:
+        _cache = AudioCache()
+    return _cache
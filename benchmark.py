@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks for the text side of the pipeline (no audio, no network).
+
+Builds synthetic Whisper-style SRTs and lyric sheets of growing size from
+lyricExamples.txt and times the tokenizer, aligner, SrtSync and LRC conversion.
+
+    python benchmark.py --out bench.json
+    python benchmark.py --compare old.json bench.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+from CbxTokenizer import CbxTokenizer
+from CbxAligner import CbxAligner
+from SrtSync import SrtSync
+from SrtCue import format_timestamp
+from utils import srt_to_lrc_json
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lyricExamples.txt")
+FILLERS = ["yeah", "oh", "uh", "baby", "the", "and"]
+
+def load_songs(path=EXAMPLES_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [song.strip() for song in f.read().split('-----') if song.strip()]
+
+def build_lyrics(songs, n_songs):
+    """Lyric sheet made of n_songs example songs (cycled)"""
+    return '\n\n'.join(songs[i % len(songs)] for i in range(n_songs))
+
+def build_transcript(lyrics, rng, word_error=0.08, repeat=0.1, drop=0.05):
+    """Whisper-style SRT of the lyrics with injected word errors, repeated and dropped lines"""
+    blocks = []
+    t = rng.randint(0, 15000)
+    for line in lyrics.split('\n'):
+        line = line.strip()
+        if not line or (line.startswith('[') and line.endswith(']')):
+            continue
+        if rng.random() < drop:
+            continue
+        copies = 2 if rng.random() < repeat else 1
+        for _ in range(copies):
+            words = [rng.choice(FILLERS) if rng.random() < word_error else w.lower() for w in line.split()]
+            duration = rng.randint(1500, 4500)
+            blocks.append(f"{len(blocks) + 1}\n{format_timestamp(t)} --> {format_timestamp(t + duration)}\n{' '.join(words)}\n")
+            t += duration + rng.randint(0, 800)
+    return '\n'.join(blocks)
+
+def measure(fn, repeat):
+    """Best wall time over repeat runs, plus peak traced memory of one run"""
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+def run_benchmarks(sizes, repeat=3, seed=1234):
+    songs = load_songs()
+    tokenizer = CbxTokenizer()
+    aligner = CbxAligner()
+    section_aligner = CbxAligner(strategy=CbxAligner.STRATEGY_SECTIONS)
+    anchor_aligner = CbxAligner(strategy=CbxAligner.STRATEGY_ANCHORS)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_songs in sizes:
+            rng = random.Random(seed + n_songs)
+            lyrics = build_lyrics(songs, n_songs)
+            srt = build_transcript(lyrics, rng)
+            srt_path = os.path.join(tmp, f"bench_{n_songs}.srt")
+            txt_path = os.path.join(tmp, f"bench_{n_songs}.txt")
+            with open(srt_path, 'w', encoding='utf-8') as f:
+                f.write(srt)
+            with open(txt_path, 'w', encoding='utf-8') as f:
+                f.write(lyrics)
+            transcript_text = '\n'.join(line for line in srt.split('\n') if line and '-->' not in line and not line.isdigit())
+            toks1 = tokenizer.tokenize_lyrics(transcript_text)
+            toks2 = tokenizer.tokenize_lyrics(lyrics)
+            with contextlib.redirect_stdout(io.StringIO()):
+                SrtSync().sync(srt_path, txt_path)
+            synced_path = txt_path + ".srt"
+
+            cases = {
+                "tokenize_lyrics": (lambda: tokenizer.tokenize_lyrics(lyrics), len(toks2), "tokens"),
+                "alignToks": (lambda: aligner.alignToks(toks1, toks2), len(toks1) * len(toks2), "cells"),
+                "alignSections": (lambda: section_aligner.alignToks(toks1, toks2), len(toks1) * len(toks2), "cells"),
+                "alignAnchors": (lambda: anchor_aligner.alignToks(toks1, toks2), len(toks1) * len(toks2), "cells"),
+                "SrtSync.sync": (lambda: SrtSync().sync(srt_path, txt_path), srt.count('-->'), "blocks"),
+                "srt_to_lrc_json": (lambda: srt_to_lrc_json(synced_path), srt.count('-->'), "blocks"),
+            }
+            for name, (fn, units, unit_name) in cases.items():
+                seconds, peak = measure(fn, repeat)
+                results.append({
+                    "benchmark": name,
+                    "songs": n_songs,
+                    "units": units,
+                    "unit": unit_name,
+                    "seconds": seconds,
+                    "throughput": units / seconds if seconds > 0 else None,
+                    "peak_bytes": peak,
+                })
+                print(f"{name:16s} songs={n_songs:3d} {unit_name}={units:9d} {seconds * 1000:10.2f} ms  peak={peak / 1024:9.0f} KB")
+    return results
+
+def scaling_curves(results):
+    """Per benchmark: seconds as a function of size, for plotting"""
+    curves = {}
+    for r in results:
+        curve = curves.setdefault(r["benchmark"], {"songs": [], "units": [], "seconds": [], "peak_bytes": []})
+        for key in ("songs", "units", "seconds", "peak_bytes"):
+            curve[key].append(r[key])
+    return curves
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(EXAMPLES_PATH),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old, new, threshold):
+    """Print per-case ratios; return the cases slower than 1 + threshold"""
+    old_index = {(r["benchmark"], r["songs"]): r for r in old["results"]}
+    regressions = []
+    print(f"Comparing {old.get('revision')} -> {new.get('revision')} (threshold {threshold:.0%})")
+    for r in new["results"]:
+        before = old_index.get((r["benchmark"], r["songs"]))
+        if before is None or before["seconds"] <= 0:
+            continue
+        ratio = r["seconds"] / before["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append((r["benchmark"], r["songs"], ratio))
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{r['benchmark']:16s} songs={r['songs']:3d} {before['seconds'] * 1000:10.2f} ms -> {r['seconds'] * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for tokenizer, aligner, SrtSync and LRC conversion.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 2, 4, 8], help="Lyric sheet sizes, in songs")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case (best time is kept)")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--out', type=str, help="Write results as JSON to this path")
+    parser.add_argument('--compare', type=str, nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    results = run_benchmarks(args.sizes, args.repeat, args.seed)
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+        "curves": scaling_curves(results),
+    }
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
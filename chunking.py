@@ -0,0 +1,168 @@
+"""
+Chunked parallel transcription of long tracks.
+
+The waveform is cut at low-energy points into windows that overlap by a few
+seconds, the windows are transcribed in a process pool, and the window results
+are stitched back into one segment list on the track's timeline.
+"""
+import os
+import re
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from vad import SAMPLE_RATE, frame_energy_db
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for chunked transcription (0 disables chunking)
+CHUNK_PROCESSES = int(os.environ.get("LRC_SYNC_CHUNK_PROCESSES", "0"))
+# Target window length and the overlap added on each side of a cut
+CHUNK_SECONDS = float(os.environ.get("LRC_SYNC_CHUNK_SECONDS", "60"))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get("LRC_SYNC_CHUNK_OVERLAP_SECONDS", "4"))
+
+def find_cuts(audio, chunk_seconds: float = CHUNK_SECONDS, search_seconds: float = 8.0,
+              sample_rate: int = SAMPLE_RATE, frame_ms: int = 30) -> list:
+    """Sample offsets [0, c1, ..., len(audio)] roughly chunk_seconds apart, each moved to
+    the quietest frame within search_seconds of its target"""
+    frame = int(sample_rate * frame_ms / 1000)
+    db = frame_energy_db(audio, sample_rate, frame_ms)
+    frames_per_chunk = max(int(chunk_seconds * 1000 / frame_ms), 1)
+    search = int(search_seconds * 1000 / frame_ms)
+    cuts = [0]
+    target = frames_per_chunk
+    while target < len(db) - frames_per_chunk // 2:
+        lo, hi = max(target - search, cuts[-1] // frame + 1), min(target + search, len(db))
+        cut = lo + int(np.argmin(db[lo:hi]))
+        cuts.append(cut * frame)
+        target = cut + frames_per_chunk
+    cuts.append(len(audio))
+    return cuts
+
+def windows_from_cuts(cuts: list, overlap_seconds: float = CHUNK_OVERLAP_SECONDS, sample_rate: int = SAMPLE_RATE) -> list:
+    """(start, end) windows covering [cuts[i], cuts[i + 1]) plus the overlap on each side"""
+    overlap = int(overlap_seconds * sample_rate)
+    return [(max(start - overlap, 0), min(end + overlap, cuts[-1])) for start, end in zip(cuts, cuts[1:])]
+
+def _words(text: str) -> list:
+    return re.findall(r"[\w']+", text.lower())
+
+def _drop_repeated_words(previous: str, text: str, max_words: int = 8) -> str:
+    """Remove from the start of text the words that repeat the end of previous"""
+    prev_words, words = _words(previous), _words(text)
+    for n in range(min(max_words, len(prev_words), len(words)), 0, -1):
+        if prev_words[-n:] == words[:n]:
+            # Cut text after its n-th word, keeping the original spelling of the rest
+            matches = list(re.finditer(r"[\w']+", text))
+            return text[matches[n - 1].end():].lstrip(" ,.;:!?-")
+    return text
+
+def stitch_segments(window_results: list, cuts: list, sample_rate: int = SAMPLE_RATE) -> list:
+    """Merge per-window segments (timed from each window start) into one list.
+
+    Each segment is kept only by the window whose own span [cut_i, cut_i+1)
+    contains its midpoint, so segments in the overlaps appear once; words a
+    kept segment repeats from the previous (time-overlapping) one are dropped."""
+    windows = windows_from_cuts(cuts, 0, sample_rate)
+    segments = []
+    for i, ((window_start, _), segs) in enumerate(window_results):
+        offset = window_start / sample_rate
+        own_start, own_end = windows[i][0] / sample_rate, windows[i][1] / sample_rate
+        for seg in segs:
+            start, end = seg["start"] + offset, seg["end"] + offset
+            middle = (start + end) / 2
+            if not (own_start <= middle < own_end or (i == len(windows) - 1 and middle >= own_end)):
+                continue
+            text = seg["text"]
+            if segments and start < segments[-1]["end"]:
+                text = _drop_repeated_words(segments[-1]["text"], text)
+                if not text.strip():
+                    continue
+            segments.append({"id": len(segments), "start": start, "end": end, "text": text})
+    return segments
+
+def _transcribe_window(engine: str, model_size: str, device: str, decode_options: dict, audio) -> dict:
+    """Pool worker: transcribe one window with the worker process's own model"""
+    from transcribers import get_transcriber
+    return get_transcriber(engine).transcribe("<window>", model_size, device, decode_options, audio)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ProcessPoolExecutor:
+    """Shared process pool; spawned, not forked, so workers do not inherit CUDA/torch state"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=CHUNK_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def should_chunk(audio) -> bool:
+    return CHUNK_PROCESSES > 0 and audio is not None and len(audio) > 1.5 * CHUNK_SECONDS * SAMPLE_RATE
+
+def transcribe_chunked(engine: str, model_size: str, device: str = None, decode_options: dict = None, audio=None, pool=None) -> dict:
+    """Transcribe overlapping windows of audio in parallel and stitch the results"""
+    cuts = find_cuts(audio)
+    windows = windows_from_cuts(cuts)
+    logger.info(f"Transcribing {len(windows)} windows of ~{CHUNK_SECONDS:.0f}s in parallel")
+    pool = pool or get_pool()
+    futures = [
+        pool.submit(_transcribe_window, engine, model_size, device, decode_options or {}, np.ascontiguousarray(audio[start:end]))
+        for start, end in windows
+    ]
+    results = [future.result() for future in futures]
+    segments = stitch_segments([(window, result["segments"]) for window, result in zip(windows, results)], cuts)
+    languages = [result.get("language") for result in results if result.get("language")]
+    return {
+        "text": "".join(seg["text"] for seg in segments),
+        "language": max(set(languages), key=languages.count) if languages else None,
+        "segments": segments,
+    }
+
+def test_chunking():
+    from concurrent.futures import ThreadPoolExecutor
+    rng = np.random.default_rng(0)
+    audio = (rng.standard_normal(SAMPLE_RATE * 200) * 0.1).astype(np.float32)
+    for quiet in (58, 121):
+        audio[quiet * SAMPLE_RATE:(quiet + 1) * SAMPLE_RATE] *= 0.001
+    cuts = find_cuts(audio)
+    print("cuts (s):", [c / SAMPLE_RATE for c in cuts])
+    assert len(cuts) == 4 and 58 <= cuts[1] / SAMPLE_RATE <= 59 and 121 <= cuts[2] / SAMPLE_RATE <= 122
+
+    # Word-level fake: one segment per whole second of the track inside the window
+    def fake(window):
+        start, end = window
+        offset = start / SAMPLE_RATE
+        return (window, [{"start": t - offset, "end": t + 1.0 - offset, "text": f" w{t}"}
+                         for t in range(-(-start // SAMPLE_RATE), end // SAMPLE_RATE)])
+    segments = stitch_segments([fake(w) for w in windows_from_cuts(cuts)], cuts)
+    assert [s["text"] for s in segments] == [f" w{t}" for t in range(200)], segments[:5]
+
+    assert _drop_repeated_words("and I feel so alive", "so alive, tonight we ride") == "tonight we ride"
+    assert _drop_repeated_words("hello there", "general kenobi") == "general kenobi"
+
+    import transcribers
+    transcribers.TRANSCRIBERS["fake-window"] = type("FakeWindow", (transcribers.Transcriber,), {
+        "name": "fake-window",
+        "transcribe": lambda self, path, size, device=None, options=None, audio=None: {
+            "language": "en", "segments": [{"start": len(audio) / SAMPLE_RATE / 2, "end": len(audio) / SAMPLE_RATE / 2 + 1, "text": f" {len(audio)}"}]},
+    })
+    try:
+        with ThreadPoolExecutor(2) as pool:
+            entry = transcribe_chunked("fake-window", "tiny", audio=audio, pool=pool)
+    finally:
+        del transcribers.TRANSCRIBERS["fake-window"]
+    print(entry["segments"])
+    assert len(entry["segments"]) == 3
+    print("Chunking OK")
+
+if __name__ == "__main__":
+    test_chunking()
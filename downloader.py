@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from tempfile import NamedTemporaryFile
+from urllib.parse import urlsplit
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("LRC_SYNC_DOWNLOAD_CONNECT_TIMEOUT", "10"))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("LRC_SYNC_DOWNLOAD_READ_TIMEOUT", "60"))
+DEFAULT_MAX_MB = int(os.environ.get("LRC_SYNC_DOWNLOAD_MAX_MB", "200"))
+DEFAULT_PER_HOST = int(os.environ.get("LRC_SYNC_DOWNLOAD_PER_HOST", "4"))
+
+# Chunk size starts here and adapts to how fast the server sends data
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+class DownloadError(Exception):
+    pass
+
+class DownloadTooLarge(DownloadError):
+    pass
+
+class Downloader:
+    """Pooled HTTP downloader with timeouts, per-host concurrency limits and a size guard"""
+
+    def __init__(self, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 max_mb: int = DEFAULT_MAX_MB, per_host: int = DEFAULT_PER_HOST):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.per_host = per_host
+        self.session = requests.Session()
+        # Keep up to per_host connections alive for each CDN host
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, url: str):
+        host = urlsplit(url).netloc
+        with self._lock:
+            return self._host_slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+
+    def download(self, url: str, suffix: str = '.mp3') -> str:
+        """Download url to a temporary file and return its path"""
+        with self._slot(url), time_stage("download"):
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, stream=True, timeout=self.timeout)
+            except requests.Timeout as e:
+                raise DownloadError(f"Timed out waiting for {url}: {e}") from e
+            with response:
+                response.raise_for_status()
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise DownloadTooLarge(f"{url} is {int(length)} bytes, limit is {self.max_bytes}")
+
+                with NamedTemporaryFile(suffix=suffix, delete=False) as tmp_file:
+                    try:
+                        size = self._stream(response, tmp_file, url)
+                    except Exception:
+                        tmp_file.close()
+                        os.unlink(tmp_file.name)
+                        raise
+            logger.info(f"Downloaded {size} bytes from {url} in {time.perf_counter() - start:.2f}s")
+            return tmp_file.name
+
+    def _stream(self, response, out, url: str) -> int:
+        chunk_size = MIN_CHUNK_SIZE
+        size = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                chunk = response.raw.read(chunk_size, decode_content=True)
+            except (urllib3.exceptions.HTTPError, OSError) as e:
+                # Raw reads raise urllib3 errors (e.g. ReadTimeoutError), not requests ones
+                raise DownloadError(f"Error reading {url}: {e}") from e
+            if not chunk:
+                return size
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise DownloadTooLarge(f"{url} exceeds {self.max_bytes} bytes")
+            out.write(chunk)
+            # Grow chunks while full reads are fast, shrink when the server is slow
+            elapsed = time.perf_counter() - t0
+            if len(chunk) == chunk_size and elapsed < 0.05:
+                chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+            elif elapsed > 0.5:
+                chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+
+    async def download_async(self, url: str, suffix: str = '.mp3') -> str:
+        """Asyncio wrapper around download, run on a worker thread"""
+        return await asyncio.to_thread(self.download, url, suffix)
+
+    async def download_many(self, urls: list, suffix: str = '.mp3') -> list:
+        """Download several URLs in parallel; each result is a path or the raised exception"""
+        return await asyncio.gather(*(self.download_async(url, suffix) for url in urls), return_exceptions=True)
+
+    def close(self):
+        self.session.close()
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+def get_downloader() -> Downloader:
+    """Shared downloader so connections are reused across requests"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
+
+def test_downloader():
+    """Exercise the downloader against a local HTTP stand-in server"""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    payload = os.urandom(3 * 1024 * 1024)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/stall":
+                time.sleep(2)
+            if self.path == "/missing":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.handle_error = lambda request, client_address: None  # Aborted downloads reset connections
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    paths = []
+    try:
+        downloader = Downloader(read_timeout=1, max_mb=4, per_host=2)
+        path = downloader.download(base + "/song.mp3")
+        paths.append(path)
+        with open(path, 'rb') as f:
+            assert f.read() == payload
+        print("Sync download: OK")
+
+        results = asyncio.run(downloader.download_many([base + f"/song{i}.mp3" for i in range(4)] + [base + "/missing"]))
+        paths.extend(r for r in results if isinstance(r, str))
+        assert sum(isinstance(r, str) for r in results) == 4
+        assert isinstance(results[-1], requests.HTTPError)
+        print("Async parallel download: OK")
+
+        try:
+            Downloader(max_mb=1).download(base + "/song.mp3")
+            raise AssertionError("size guard did not trigger")
+        except DownloadTooLarge:
+            print("Size guard: OK")
+
+        try:
+            downloader.download(base + "/stall")
+            raise AssertionError("read timeout did not trigger")
+        except (DownloadError, requests.Timeout):
+            print("Read timeout: OK")
+    finally:
+        server.shutdown()
+        for path in paths:
+            os.unlink(path)
+
+if __name__ == "__main__":
+    test_downloader()
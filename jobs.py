@@ -0,0 +1,195 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from metrics import FAILURES
+
+logger = logging.getLogger(__name__)
+
+# Number of songs processed at the same time
+DEFAULT_MAX_WORKERS = int(os.environ.get("LRC_SYNC_MAX_WORKERS", "1"))
+# Jobs allowed to wait for a worker before new ones are turned away
+DEFAULT_MAX_QUEUED = int(os.environ.get("LRC_SYNC_MAX_QUEUED", "16"))
+# Finished jobs kept around for GET /jobs/{id}
+DEFAULT_MAX_FINISHED_JOBS = int(os.environ.get("LRC_SYNC_MAX_FINISHED_JOBS", "1000"))
+
+class QueueFull(Exception):
+    """Raised by JobManager.submit when max_queued jobs are already waiting"""
+
+    def __init__(self, queued: int, retry_after: int):
+        super().__init__(f"{queued} jobs already queued, retry in {retry_after}s")
+        self.queued = queued
+        self.retry_after = retry_after
+
+class Job:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, job_id: str, stages: list):
+        self.id = job_id
+        self.status = self.QUEUED
+        self.stages = OrderedDict((stage, {"status": "pending", "progress": 0.0}) for stage in stages)
+        self.result = None
+        self.partial = None  # LRC lines aligned so far, while transcribing
+        self.error = None
+        self.exception = None
+        self.future = None
+        self.external = False  # Run outside the executor (see JobManager.create)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def update_stage(self, stage: str, status: str, progress: float = None, partial: list = None):
+        if partial is not None:
+            self.partial = partial
+        info = self.stages.setdefault(stage, {"status": "pending", "progress": 0.0})
+        info["status"] = status
+        if progress is not None:
+            info["progress"] = progress
+        elif status == "done":
+            info["progress"] = 1.0
+        if status == "running" and "started_at" not in info:
+            info["started_at"] = time.time()
+            if self.status == self.QUEUED:
+                self.status = self.RUNNING
+                self.started_at = info["started_at"]
+        if status == "done":
+            info["seconds"] = round(time.time() - info.get("started_at", time.time()), 3)
+
+    def fail(self, e: Exception):
+        """Record a failure, attributing it to the stage that was running"""
+        self.exception = e
+        self.error = {"error": str(e), "type": type(e).__name__}
+        self.status = self.FAILED
+        stage = next((name for name, info in self.stages.items() if info["status"] in ("running", "failed")), "unknown")
+        self.stages.get(stage, {})["status"] = "failed"
+        FAILURES.inc(stage=stage, exception=type(e).__name__)
+
+    @property
+    def queue_seconds(self):
+        """Time spent waiting for a worker"""
+        if self.started_at is None:
+            return None
+        return round(self.started_at - self.created_at, 3)
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": {name: {k: v for k, v in info.items() if k != "started_at"} for name, info in self.stages.items()},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_seconds": self.queue_seconds,
+        }
+        if self.status == self.DONE:
+            data["result"] = self.result
+        elif self.partial is not None:
+            data["partial"] = self.partial
+        if self.status == self.FAILED:
+            data["error"] = self.error
+        return data
+
+class JobManager:
+    """Runs process_audio-style functions on a bounded executor and tracks their progress"""
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_finished_jobs: int = DEFAULT_MAX_FINISHED_JOBS,
+                 max_queued: int = DEFAULT_MAX_QUEUED):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lrc-job")
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.max_queued = max_queued  # 0 means unbounded
+        self._durations = deque(maxlen=50)  # Recent job run times, for Retry-After
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, stages: list = (), **kwargs) -> Job:
+        """Queue fn(*args, progress=callback, **kwargs) and return its Job immediately
+        
+        Raises QueueFull when max_queued jobs are already waiting for a worker"""
+        self.admit(self.queued())
+        job = self._register(Job(uuid.uuid4().hex, list(stages)))
+        job.future = self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def admit(self, queued: int):
+        """Raise QueueFull if queued waiting items already use up the max_queued budget"""
+        if self.max_queued > 0 and queued >= self.max_queued:
+            raise QueueFull(queued, self.retry_after(queued))
+
+    def create(self, stages: list = ()) -> Job:
+        """Register a job whose work is run elsewhere (see attach); it does not count
+        towards the executor's queue"""
+        job = Job(uuid.uuid4().hex, list(stages))
+        job.external = True
+        return self._register(job)
+
+    def _register(self, job: Job) -> Job:
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def attach(self, job: Job, future, result=lambda value: value):
+        """Track a future produced outside the executor (e.g. by the batch pipeline)"""
+        def done(f):
+            job.finished_at = time.time()
+            if f.exception() is not None:
+                job.fail(f.exception())
+            else:
+                job.result = result(f.result())
+                job.status = Job.DONE
+        job.future = future
+        future.add_done_callback(done)
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        job.status = Job.RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, progress=job.update_stage, **kwargs)
+            job.status = Job.DONE
+            return job.result
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            job.fail(e)
+            raise
+        finally:
+            job.finished_at = time.time()
+            self._durations.append(job.finished_at - job.started_at)
+
+    def retry_after(self, queued: int) -> int:
+        """Seconds until a queue slot is likely to free up, from recent job run times"""
+        durations = list(self._durations)
+        average = sum(durations) / len(durations) if durations else 30.0
+        return max(1, int(average * (queued - self.max_queued + 1) / self.max_workers + 0.5))
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished_jobs"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (Job.DONE, Job.FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def queued(self) -> int:
+        """Jobs waiting for an executor worker"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == Job.QUEUED and not job.external)
+
+    def counts(self) -> dict:
+        with self._lock:
+            counts = {Job.QUEUED: 0, Job.RUNNING: 0, Job.DONE: 0, Job.FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,325 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Memory budget for resident models, in MB (0 means unbounded)
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("WHISPER_MODEL_MEMORY_BUDGET_MB", "0"))
+
+def _load_whisper_model(model_size: str, device: str = None):
+    """Load a Whisper model from disk (or the download cache)"""
+    import whisper
+    return whisper.load_model(model_size, device=device)
+
+def estimate_model_bytes(model) -> int:
+    """Estimate the resident size of a (PyTorch) model from its parameters and buffers; 0 for other models"""
+    total = 0
+    for attr in ("parameters", "buffers"):
+        tensors = getattr(model, attr, None)
+        if tensors is None:
+            continue
+        for t in tensors():
+            total += t.numel() * t.element_size()
+    return total
+
+def rss_bytes() -> int:
+    """Resident set size of this process from /proc/self/statm, or 0 when unknown"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def model_label(model_size: str, device: str = None, engine: str = "whisper") -> str:
+    """Name of a model in stats and metrics, e.g. large@default or faster-whisper:large@cpu"""
+    label = f"{model_size}@{device or 'default'}"
+    return label if engine == "whisper" else f"{engine}:{label}"
+
+class ModelRegistry:
+    """Process-wide cache of loaded models keyed by (engine, model_size, device, replica), with LRU eviction.
+
+    Replica 0 is the shared copy; ReplicaPool loads further copies under higher
+    replica numbers, so they count towards the same hit/load/memory accounting.
+    Whisper models come from loader; other engines register theirs with register_loader."""
+
+    def __init__(self, memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB, loader=_load_whisper_model):
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.loader = loader
+        self.loaders = {}  # engine -> loader(model_size, device), besides whisper
+        self._models = OrderedDict()  # (engine, model_size, device, replica) -> (model, nbytes)
+        self._pinned = set()  # Keys in use that eviction must skip
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> Lock, so concurrent misses load a model only once
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def register_loader(self, engine: str, loader):
+        self.loaders[engine] = loader
+
+    def get(self, model_size: str, device: str = None, replica: int = 0, pin: bool = False, engine: str = "whisper"):
+        """Return a resident model, loading it (and evicting others) if needed.
+
+        pin=True keeps it from being evicted until unpin() is called."""
+        key = (engine, model_size, device, replica)
+        with self._lock:
+            if key in self._models:
+                return self._hit(key, pin)
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                if key in self._models:
+                    return self._hit(key, pin)
+                self.misses += 1
+
+            logger.info(f"Loading model {model_label(model_size, device, engine)}" + (f" (replica {replica})" if replica else ""))
+            loader = self.loader if engine == "whisper" else self.loaders[engine]
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            model = loader(model_size, device)
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage="model_load")
+            # Models without torch tensors (e.g. CTranslate2) are sized by the memory their load took
+            nbytes = estimate_model_bytes(model) or max(rss_bytes() - rss_before, 0)
+            logger.info(f"Loaded model {model_size} in {elapsed:.2f}s ({nbytes / 1024 / 1024:.0f} MB)")
+
+            with self._lock:
+                self.load_seconds += elapsed
+                self._models[key] = (model, nbytes)
+                if pin:
+                    self._pinned.add(key)
+                self._evict_over_budget(keep=key)
+                self._loading.pop(key, None)
+            return model
+
+    def _hit(self, key, pin: bool):
+        self._models.move_to_end(key)
+        self.hits += 1
+        if pin:
+            self._pinned.add(key)
+        return self._models[key][0]
+
+    def unpin(self, model_size: str, device: str = None, replica: int = 0, engine: str = "whisper"):
+        with self._lock:
+            self._pinned.discard((engine, model_size, device, replica))
+            self._evict_over_budget(keep=None)
+
+    def _evict_over_budget(self, keep):
+        """Drop least recently used unpinned models until resident size fits the budget"""
+        if self.memory_budget_bytes <= 0:
+            return
+        while self.resident_bytes() > self.memory_budget_bytes:
+            victim = next((k for k in self._models if k != keep and k not in self._pinned), None)
+            if victim is None:
+                break
+            del self._models[victim]
+            self.evictions += 1
+            logger.info(f"Evicted model {model_label(victim[1], victim[2], victim[0])}")
+
+    def resident_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._models.values())
+
+    def model_bytes(self, model_size: str, device: str = None, replica: int = 0, engine: str = "whisper") -> int:
+        """Estimated size of a resident model, or 0"""
+        with self._lock:
+            entry = self._models.get((engine, model_size, device, replica))
+            return entry[1] if entry else 0
+
+    def other_resident_bytes(self, model_size: str, device: str = None, engine: str = "whisper") -> int:
+        """Resident size of every model except the replicas of (engine, model_size, device)"""
+        with self._lock:
+            return sum(nbytes for key, (_, nbytes) in self._models.items() if key[:3] != (engine, model_size, device))
+
+    def evict(self, model_size: str, device: str = None, engine: str = "whisper") -> bool:
+        """Explicitly drop a model (all its unpinned replicas) from the registry"""
+        with self._lock:
+            keys = [k for k in self._models if k[:3] == (engine, model_size, device) and k not in self._pinned]
+            for key in keys:
+                del self._models[key]
+            return bool(keys)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss and load-time counters for monitoring"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_seconds": round(self.load_seconds, 3),
+                "resident_bytes": self.resident_bytes(),
+                "resident_models": [model_label(size, device, engine) + (f"#{replica}" if replica else "")
+                                    for engine, size, device, replica in self._models],
+            }
+
+# Shared registry; transcribers load models through replicas
+registry = ModelRegistry()
+
+# Model copies that may run at the same time, per (model_size, device)
+DEFAULT_MAX_REPLICAS = int(os.environ.get("LRC_SYNC_MAX_REPLICAS", "1"))
+# Memory the replicas may use, in MB (0 means the MemAvailable reported at sizing time)
+DEFAULT_REPLICA_MEMORY_MB = int(os.environ.get("LRC_SYNC_REPLICA_MEMORY_MB", "0"))
+
+def available_memory_bytes() -> int:
+    """MemAvailable from /proc/meminfo, or 0 when unknown"""
+    try:
+        with open("/proc/meminfo", 'r') as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+class _Replicas:
+    def __init__(self):
+        self.free = []  # Replica numbers not in use
+        self.loaded = 0  # Replica numbers handed out so far
+        self.capacity = 1  # Until the first replica is loaded and measured
+        self.sized = False
+        self.waiting = 0
+
+class ReplicaPool:
+    """Up to max_replicas copies of each model, each used by one transcription at a time.
+
+    Copies live in the registry as replicas 0, 1, ... of (engine, model_size, device);
+    each acquire() goes through
+    registry.get (pinned while in use), so hits, load times, the memory budget and
+    LRU eviction cover every copy. More copies are added on demand while the memory
+    budget allows. acquire() blocks until a copy is free."""
+
+    def __init__(self, registry: ModelRegistry, max_replicas: int = DEFAULT_MAX_REPLICAS, memory_mb: int = DEFAULT_REPLICA_MEMORY_MB):
+        self.registry = registry
+        self.max_replicas = max(1, max_replicas)
+        self.memory_mb = memory_mb
+        self._replicas = {}  # (engine, model_size, device) -> _Replicas
+        self._cond = threading.Condition()
+
+    def _capacity(self, model_size: str, device: str, replica: int, engine: str) -> int:
+        """Replicas that fit the memory budget, given the size of one; with a registry
+        budget, also only what it holds next to the other resident models, so pinned
+        copies are not evicted as soon as they are released"""
+        nbytes = self.registry.model_bytes(model_size, device, replica, engine)
+        if nbytes <= 0:
+            return self.max_replicas
+        budget = self.memory_mb * 1024 * 1024 or available_memory_bytes() + nbytes
+        capacity = min(self.max_replicas, budget // nbytes) if budget > 0 else self.max_replicas
+        if self.registry.memory_budget_bytes > 0:
+            free = self.registry.memory_budget_bytes - self.registry.other_resident_bytes(model_size, device, engine)
+            capacity = min(capacity, free // nbytes)
+        return max(1, int(capacity))
+
+    @contextmanager
+    def acquire(self, model_size: str, device: str = None, lease: dict = None, engine: str = "whisper"):
+        """Yield a model copy for exclusive use; lease, if given, receives wait time and occupancy"""
+        key = (engine, model_size, device)
+        start = time.perf_counter()
+        with self._cond:
+            replicas = self._replicas.setdefault(key, _Replicas())
+            replicas.waiting += 1
+            while not replicas.free and replicas.loaded >= replicas.capacity:
+                self._cond.wait()
+            replicas.waiting -= 1
+            if replicas.free:
+                index, new = replicas.free.pop(), False
+            else:
+                index, new = replicas.loaded, True
+                replicas.loaded += 1
+        try:
+            model = self.registry.get(model_size, device, replica=index, pin=True, engine=engine)
+        except Exception:
+            with self._cond:
+                if new:
+                    replicas.loaded -= 1
+                else:
+                    replicas.free.append(index)
+                self._cond.notify()
+            raise
+        if not replicas.sized:
+            capacity = self._capacity(model_size, device, index, engine)
+            logger.info(f"Up to {capacity} replicas of model {model_label(model_size, device, engine)}")
+            with self._cond:
+                replicas.capacity = capacity
+                replicas.sized = True
+                self._cond.notify_all()
+        wait = time.perf_counter() - start
+        STAGE_SECONDS.observe(wait, stage="replica_wait")
+        with self._cond:
+            busy = replicas.loaded - len(replicas.free)
+            if lease is not None:
+                lease.update({"wait_seconds": round(wait, 3), "busy": busy, "replicas": replicas.capacity})
+        try:
+            yield model
+        finally:
+            self.registry.unpin(model_size, device, index, engine)
+            with self._cond:
+                replicas.free.append(index)
+                self._cond.notify()
+
+    def stats(self) -> dict:
+        """Per model: loaded, busy and maximum replicas, and transcriptions waiting for one"""
+        with self._cond:
+            return {
+                model_label(size, device, engine): {
+                    "loaded": r.loaded,
+                    "busy": r.loaded - len(r.free),
+                    "capacity": r.capacity,
+                    "waiting": r.waiting,
+                }
+                for (engine, size, device), r in self._replicas.items()
+            }
+
+# Whisper model copies handed out to concurrent transcriptions
+replicas = ReplicaPool(registry)
+
+def test_replica_budget():
+    class Tensor:
+        def numel(self):
+            return 100 * 1024 * 1024
+        def element_size(self):
+            return 1
+    class Model:
+        def parameters(self):
+            return [Tensor()]
+        def buffers(self):
+            return []
+    test_registry = ModelRegistry(memory_budget_mb=250, loader=lambda size, device: Model())
+    pool = ReplicaPool(test_registry, max_replicas=4, memory_mb=10000)
+
+    # Four concurrent transcriptions: only two 100 MB copies fit the 250 MB budget
+    release = threading.Event()
+    def transcribe():
+        with pool.acquire("large"):
+            release.wait()
+    threads = [threading.Thread(target=transcribe) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    print(pool.stats())
+    assert pool.stats()["large@default"]["capacity"] == 2
+    assert pool.stats()["large@default"]["busy"] == 2
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    for _ in range(6):
+        with pool.acquire("large"):
+            pass
+    stats = test_registry.stats()
+    print(stats)
+    assert stats["misses"] == 2 and stats["evictions"] == 0 and stats["hits"] == 8
+    print("Replica budget OK")
+
+if __name__ == "__main__":
+    test_replica_budget()
@@ -0,0 +1,151 @@
+import time
+import queue
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """One step of a Pipeline: fn(ctx) run by its own worker threads"""
+
+    def __init__(self, name: str, fn, workers: int = 1, queue_size: int = 4):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+        self.busy_seconds = 0.0
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.busy_seconds += seconds
+            if ok:
+                self.processed += 1
+            else:
+                self.failed += 1
+
+class _Intake:
+    """Unbounded FIFO feeding the first stage, so submit() never blocks the caller"""
+
+    def __init__(self):
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self):
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            return self._items.popleft()
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+class Pipeline:
+    """Overlapped producer/consumer pipeline.
+
+    Each stage has its own worker threads and a bounded input queue, so e.g.
+    downloads and decodes for the next songs run while the current one is
+    transcribed, without running arbitrarily far ahead."""
+
+    _STOP = object()
+
+    def __init__(self, stages: list, on_stage=None, on_finish=None):
+        self.stages = stages
+        self.on_stage = on_stage  # on_stage(ctx, stage_name, status)
+        self.on_finish = on_finish  # on_finish(ctx), called after success or failure
+        self._queues = [_Intake()] + [queue.Queue(maxsize=stage.queue_size) for stage in stages[1:]]
+        self._threads = []
+        self._started_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._started_at = time.perf_counter()
+            for i, stage in enumerate(self.stages):
+                for w in range(stage.workers):
+                    thread = threading.Thread(target=self._work, args=(i,), name=f"pipeline-{stage.name}-{w}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, ctx: dict) -> Future:
+        """Queue ctx for the first stage; the future resolves to ctx once the last stage ran"""
+        self.start()
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self._queues[0].put((ctx, future))
+        return future
+
+    def waiting(self) -> int:
+        """Submitted items not yet picked up by the first stage"""
+        return self._queues[0].qsize()
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        inbox = self._queues[index]
+        while True:
+            item = inbox.get()
+            if item is self._STOP:
+                return
+            ctx, future = item
+            if self.on_stage:
+                self.on_stage(ctx, stage.name, "running")
+            start = time.perf_counter()
+            try:
+                stage.fn(ctx)
+            except Exception as e:
+                stage.record(time.perf_counter() - start, ok=False)
+                logger.error(f"Pipeline stage {stage.name} failed: {str(e)}", exc_info=True)
+                if self.on_stage:
+                    self.on_stage(ctx, stage.name, "failed")
+                self._finish(ctx)
+                future.set_exception(e)
+                continue
+            stage.record(time.perf_counter() - start, ok=True)
+            if self.on_stage:
+                self.on_stage(ctx, stage.name, "done")
+
+            if index + 1 < len(self.stages):
+                # Blocks while the next stage is saturated (backpressure)
+                self._queues[index + 1].put((ctx, future))
+            else:
+                self._finish(ctx)
+                future.set_result(ctx)
+
+    def _finish(self, ctx: dict):
+        if self.on_finish:
+            try:
+                self.on_finish(ctx)
+            except Exception as e:
+                logger.error(f"Pipeline cleanup failed: {str(e)}")
+
+    def stats(self) -> dict:
+        """Per-stage utilization (busy time / (workers * wall time)) and queue depth"""
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        stats = {}
+        for stage, inbox in zip(self.stages, self._queues):
+            stats[stage.name] = {
+                "workers": stage.workers,
+                "processed": stage.processed,
+                "failed": stage.failed,
+                "busy_seconds": round(stage.busy_seconds, 3),
+                "utilization": round(stage.busy_seconds / (stage.workers * elapsed), 3) if elapsed > 0 else 0.0,
+                "queue_depth": inbox.qsize(),
+            }
+        return stats
+
+    def shutdown(self):
+        """Ask every worker to exit after the items already queued ahead of it"""
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self._queues[i].put(self._STOP)
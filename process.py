@@ -1,43 +1,93 @@
 import os
-from tempfile import NamedTemporaryFile
-from pathlib import Path
-from utils import download_mp3, srt_to_lrc_json, cleanup_temp_files
-from transcribe import transcribe_audio
+from utils import download_mp3, cues_to_lrc_json, cues_to_lrc_lines, cleanup_temp_files
+from transcribe import transcribe_audio, decode_audio, hash_audio, is_transcript_cached, load_transcript
 from SrtSync import SrtSync
+from SrtCue import cues_from_segments
+from vad import SAMPLE_RATE
+from pipeline import Pipeline, Stage
 
-def process_audio(audio_url: str, lyrics: str) -> dict:
-    """Process audio URL and lyrics to generate synchronized LRC"""
-    temp_files = []
+# Pipeline stages reported through the progress callback
+STAGES = ["download", "decode", "transcribe", "sync"]
+
+# Workers per stage for batch processing
+DOWNLOAD_WORKERS = int(os.environ.get("LRC_SYNC_DOWNLOAD_WORKERS", "4"))
+DECODE_WORKERS = int(os.environ.get("LRC_SYNC_DECODE_WORKERS", "2"))
+TRANSCRIBE_WORKERS = int(os.environ.get("LRC_SYNC_TRANSCRIBE_WORKERS", "1"))
+SYNC_WORKERS = int(os.environ.get("LRC_SYNC_SYNC_WORKERS", "1"))
+# Songs allowed to wait between two stages (bounds decoded audio held in memory)
+STAGE_QUEUE_SIZE = int(os.environ.get("LRC_SYNC_STAGE_QUEUE_SIZE", "2"))
+
+def _no_progress(stage: str, status: str, progress: float = None, partial: list = None):
+    pass
+
+def download_stage(ctx: dict):
+    """Download MP3"""
+    ctx["mp3_path"] = download_mp3(ctx["audio_url"])
+    ctx["temp_files"].append(ctx["mp3_path"])
+
+def decode_stage(ctx: dict):
+    """Decode audio ahead of transcription, unless the transcript is already cached"""
+    ctx["audio_hash"] = hash_audio(ctx["mp3_path"])  # Read once for both caches
+    if not is_transcript_cached(ctx["mp3_path"], engine=ctx["engine"], audio_hash=ctx["audio_hash"]):
+        ctx["audio"] = decode_audio(ctx["mp3_path"], ctx["engine"], ctx["audio_hash"])
+        ctx["decoded"] = True  # Even when the engine reads the file itself (audio is None)
+
+def transcribe_stage(ctx: dict):
+    """Transcribe audio to timed cues, reporting percent done and the LRC lines aligned so far"""
+    audio = ctx.pop("audio", None)
+    duration = len(audio) / SAMPLE_RATE if audio is not None else None
+    segments = []
+    
+    def on_segment(segment):
+        segments.append(segment)
+        preview = SrtSync().preview_cues(cues_from_segments(segments), ctx["lyrics"])
+        progress = min(segment["end"] / duration, 0.99) if duration else None
+        ctx["progress"]("transcribe", "running", progress, partial=cues_to_lrc_lines(preview))
+    
+    ctx["cues"] = transcribe_audio(ctx["mp3_path"], audio=audio, engine=ctx["engine"], info=ctx["info"], on_segment=on_segment,
+                                   audio_hash=ctx.get("audio_hash"), decoded=ctx.pop("decoded", False))
+
+def sync_stage(ctx: dict):
+    """Synchronize lyrics onto the transcription timings and convert to LRC JSON"""
+    synced_cues = SrtSync().sync_cues(ctx["cues"], ctx["lyrics"])
+    ctx["result"] = cues_to_lrc_json(synced_cues)
+    ctx["result"].update(ctx["info"])  # vad and replica stats, see transcribe_audio
+
+STAGE_FUNCTIONS = [download_stage, decode_stage, transcribe_stage, sync_stage]
+
+def new_context(audio_url: str, lyrics: str, progress=None, engine=None) -> dict:
+    return {"audio_url": audio_url, "lyrics": lyrics, "progress": progress or _no_progress, "temp_files": [], "engine": engine, "info": {}}
+
+def process_audio(audio_url: str, lyrics: str, progress=None, engine=None) -> dict:
+    """Process audio URL and lyrics to generate synchronized LRC
+    
+    progress, if given, is called as progress(stage, status) when a stage starts/ends, and as
+    progress("transcribe", "running", fraction, partial=lrc_lines) as segments are transcribed;
+    engine picks the transcription engine (see transcribers.get_transcriber)"""
+    ctx = new_context(audio_url, lyrics, progress, engine)
     try:
-        # Download MP3
-        mp3_path = download_mp3(audio_url)
-        temp_files.append(mp3_path)
-
-        # Create temporary lyrics file
-        with NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as lyrics_file:
-            lyrics_file.write(lyrics)
-            lyrics_path = lyrics_file.name
-            temp_files.append(lyrics_path)
-
-        # Transcribe audio to get SRT
-        whisper_srt = transcribe_audio(mp3_path)
-        temp_files.append(whisper_srt)
-
-        # Create output SRT path
-        output_srt = mp3_path + ".synced.srt"
-        temp_files.append(output_srt)
-
-        # Synchronize
-        syncer = SrtSync()
-        syncer.sync(whisper_srt, lyrics_path)  # This will output to lyrics_path + ".srt"
-        
-        # Convert synchronized SRT to LRC JSON
-        synced_srt = lyrics_path + ".srt"
-        result = srt_to_lrc_json(synced_srt)  # Use the synchronized SRT file
-        temp_files.append(synced_srt)  # Add to temp files for cleanup
-        
-        return result
+        for name, fn in zip(STAGES, STAGE_FUNCTIONS):
+            ctx["progress"](name, "running")
+            fn(ctx)
+            ctx["progress"](name, "done")
+        return ctx["result"]
     
     finally:
         # Clean up temporary files
-        cleanup_temp_files(temp_files) 
\ No newline at end of file
+        cleanup_temp_files(ctx["temp_files"])
+
+def resync(transcript_id: str, lyrics: str) -> dict:
+    """Re-run only SrtSync and LRC conversion for new lyrics against a stored transcript"""
+    synced_cues = SrtSync().sync_cues(load_transcript(transcript_id), lyrics)
+    result = cues_to_lrc_json(synced_cues)
+    result["transcript_id"] = transcript_id
+    return result
+
+def create_pipeline() -> Pipeline:
+    """Overlapped pipeline running the process_audio stages for many songs at once"""
+    workers = [DOWNLOAD_WORKERS, DECODE_WORKERS, TRANSCRIBE_WORKERS, SYNC_WORKERS]
+    return Pipeline(
+        [Stage(name, fn, n, STAGE_QUEUE_SIZE) for name, fn, n in zip(STAGES, STAGE_FUNCTIONS, workers)],
+        on_stage=lambda ctx, stage, status: ctx["progress"](stage, status),
+        on_finish=lambda ctx: cleanup_temp_files(ctx["temp_files"]),
+    )
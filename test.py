@@ -16,6 +16,7 @@ logging.basicConfig(
 
 # Use localhost instead of ngrok
 api_url = "http://localhost:8000/process"
+batch_api_url = "http://localhost:8000/process/batch"
 
 test_data = [
 	{
@@ -257,7 +258,29 @@ def process_test_data():
         
         logging.info("=" * 50 + "\n")
 
+def process_test_data_batch():
+    logging.info(f"\n=== Processing {len(test_data)} test cases as one batch ===")
+    start_time = time.time()
+    response = requests.post(batch_api_url, json={"items": test_data})
+    processing_time = time.time() - start_time
+    
+    logging.info(f"Response Status Code: {response.status_code}")
+    logging.info(f"Processing Time: {processing_time:.2f} seconds")
+    
+    if response.status_code == 200:
+        result = response.json()
+        for item in result["items"]:
+            logging.info(f"Item {item['index']}: {item['status']} ({item.get('seconds')} seconds)")
+            logging.info(json.dumps(item.get("result", item.get("error")), indent=2))
+        logging.info(f"Server batch time: {result['seconds']} seconds")
+    else:
+        logging.error(f"Error response: {response.text}")
+
 if __name__ == "__main__":
+    import sys
     logging.info("Starting test run...")
-    process_test_data()
+    if "--batch" in sys.argv:
+        process_test_data_batch()
+    else:
+        process_test_data()
     logging.info("Test run completed.")
\ No newline at end of file
@@ -1,9 +1,14 @@
 import argparse
 from pathlib import Path
-import whisper
-from whisper.utils import WriteSRT
 import os
 import logging
+from metrics import time_stage, AUDIO_SECONDS
+from transcribers import get_transcriber
+from vad import VAD_ENABLED, VoiceActivity, detect_voice
+from chunking import CHUNK_PROCESSES, should_chunk, transcribe_chunked
+from transcript_cache import get_cache, hash_file, cache_key, is_transcript_id
+from audio_cache import get_audio_cache, audio_key
+from SrtCue import cues_from_segments, cues_to_srt, write_srt
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,55 +16,158 @@ logger = logging.getLogger(__name__)
 
 modelSize = "large"
 
-def transcribe_audio(audio_path: str, model_size: str = "large") -> str:
-    """Transcribe audio file and return path to SRT file"""
+def hash_audio(audio_path: str):
+    """SHA-256 of the audio file when a transcript or audio cache needs it, else None.
+    
+    Pass the result as audio_hash to the functions below so the file is read only once"""
+    if get_cache() is None and get_audio_cache() is None:
+        return None
+    return hash_file(audio_path)
+
+def decode_audio(audio_path: str, engine=None, audio_hash: str = None):
+    """Decode an audio file into the engine's input (16 kHz mono float32 samples with ffmpeg for Whisper)
+    
+    Waveforms are cached per audio hash and returned memory-mapped, so retries and other
+    model sizes skip decoding and concurrent workers share one copy"""
+    transcriber = get_transcriber(engine)
+    cache = get_audio_cache()
+    key = None
+    if cache is not None:
+        key = audio_key(audio_hash or hash_file(audio_path), transcriber.name)
+        audio = cache.get(key)
+        if audio is not None:
+            logger.info(f"Decoded audio cache hit for: {audio_path}")
+            return audio
+    with time_stage("decode"):
+        audio = transcriber.load_audio(audio_path)
+    if cache is not None and audio is not None:
+        audio = cache.put(key, audio)
+    return audio
+
+def _cache_key(audio_path: str, model_size: str, decode_options: dict, transcriber, audio_hash: str = None) -> str:
+    # Whisper keys predate pluggable engines; other engines get their own entries
+    options = decode_options if transcriber.name == "whisper" else dict(decode_options, engine=transcriber.name)
+    if VAD_ENABLED:
+        options = dict(options, vad=True)
+    return cache_key(audio_hash or hash_file(audio_path), model_size, options)
+
+def is_transcript_cached(audio_path: str, model_size: str = "large", decode_options: dict = None, engine=None, audio_hash: str = None) -> bool:
+    """Whether transcribe_audio would be served from the transcript cache"""
+    cache = get_cache()
+    if cache is None:
+        return False
+    return cache.contains(_cache_key(audio_path, model_size, decode_options or {}, get_transcriber(engine), audio_hash))
+
+def _run_transcriber(transcriber, audio_path: str, model_size: str, device: str, decode_options: dict, audio=None, on_segment=None,
+                     audio_hash: str = None, decoded: bool = False) -> dict:
+    """Transcribe in one piece, or in parallel overlapping windows for long audio when chunking is on"""
+    if CHUNK_PROCESSES > 0 and audio is None and not decoded:
+        audio = decode_audio(audio_path, transcriber, audio_hash)
+    if should_chunk(audio):
+        with time_stage("transcribe"):
+            entry = transcribe_chunked(transcriber.name, model_size, device, decode_options, audio)
+        # Windows finish out of order; segments are only known once stitched
+        for seg in entry["segments"] if on_segment else ():
+            on_segment(seg)
+        return entry
+    return transcriber.transcribe(audio_path, model_size, device, decode_options, audio, on_segment=on_segment)
+
+def _transcribe_voiced(transcriber, audio_path: str, model_size: str, device: str, decode_options: dict, audio=None, on_segment=None,
+                       audio_hash: str = None, decoded: bool = False) -> dict:
+    """Transcribe only the voiced regions of the audio; segment times stay on the original timeline"""
+    if audio is None and not decoded:
+        audio = decode_audio(audio_path, transcriber, audio_hash)
+    if audio is None:  # Engine reads the file itself
+        return transcriber.transcribe(audio_path, model_size, device, decode_options, on_segment=on_segment)
+    
+    with time_stage("vad"):
+        activity = detect_voice(audio)
+    if not activity.regions:
+        # Nothing found: transcribe everything rather than nothing
+        activity = VoiceActivity([(0, len(audio))], len(audio))
+    
+    logger.info(f"Voice activity: {len(activity.regions)} regions, skipping {activity.skipped_seconds:.1f}s of {activity.audio_seconds:.1f}s")
+    mapped = (lambda seg: on_segment(activity.map_segments([seg])[0])) if on_segment else None
+    entry = _run_transcriber(transcriber, audio_path, model_size, device, decode_options, activity.trim(audio), mapped)
+    entry["segments"] = activity.map_segments(entry["segments"])
+    entry["vad"] = activity.stats()
+    return entry
+
+def load_transcript(transcript_id: str) -> list:
+    """Cues of a cached transcript, by the transcript_id transcribe_audio reported
+    
+    Raises LookupError when the id is malformed, unknown or evicted from the cache"""
+    cache = get_cache()
+    if cache is None or not is_transcript_id(transcript_id):
+        raise LookupError(f"Transcript not found: {transcript_id}")
+    entry = cache.get(transcript_id)
+    if entry is None:
+        raise LookupError(f"Transcript not found: {transcript_id}")
+    return cues_from_segments(entry["segments"])
+
+def transcribe_audio(audio_path: str, model_size: str = "large", device: str = None, decode_options: dict = None, audio=None, engine=None, info: dict = None,
+                     on_segment=None, audio_hash: str = None, decoded: bool = False) -> list:
+    """Transcribe audio file and return its segments as SrtCue objects
+    
+    audio, if given, is the already decoded waveform of audio_path (see decode_audio);
+    engine is a transcribers name or Transcriber (default LRC_SYNC_TRANSCRIBER);
+    info, if given, receives "vad" (audio/voiced/skipped seconds) when VAD ran,
+    "replica" (wait seconds and occupancy of the model copy used) when a model ran
+    and "transcript_id" (see load_transcript) when the transcript is cached;
+    on_segment, if given, is called with each new segment (original timeline) as the engine produces it;
+    audio_hash, if given, is hash_audio(audio_path), so the file is not hashed again;
+    decoded means audio is what decode_audio returned, even None (the engine reads the file itself),
+    so it is not decoded again"""
     try:
         logger.info(f"Audio file path: {audio_path}")
         logger.info(f"Parent directory: {Path(audio_path).parent}")
-        logger.info(f"Loading Whisper model: {model_size}")
-        model = whisper.load_model(model_size)
         
         if not os.path.exists(audio_path):
             raise FileNotFoundError(f"Audio file not found: {audio_path}")
         
-        logger.info(f"Starting transcription for: {audio_path}")
-        result = model.transcribe(audio_path)
-        
-        logger.info(f"Transcription result: {result['text'][:100]}...")
-        
-        srt_path = audio_path + ".srt"
-        logger.info(f"Attempting to save SRT to: {srt_path}")
+        decode_options = decode_options or {}
+        transcriber = get_transcriber(engine)
+        if audio_hash is None:
+            audio_hash = hash_audio(audio_path)
+        cache = get_cache()
+        key = None
+        entry = None
+        if cache is not None:
+            key = _cache_key(audio_path, model_size, decode_options, transcriber, audio_hash)
+            entry = cache.get(key)
+            if entry is not None:
+                logger.info(f"Transcript cache hit for: {audio_path}")
+        replica = None
+        if entry is None:
+            if VAD_ENABLED:
+                entry = _transcribe_voiced(transcriber, audio_path, model_size, device, decode_options, audio, on_segment, audio_hash, decoded)
+            else:
+                entry = _run_transcriber(transcriber, audio_path, model_size, device, decode_options, audio, on_segment, audio_hash, decoded)
+            if "vad" in entry:
+                AUDIO_SECONDS.inc(entry["vad"]["voiced_seconds"], kind="voiced")
+                AUDIO_SECONDS.inc(entry["vad"]["skipped_seconds"], kind="skipped")
+            replica = entry.pop("replica", None)  # Per request, not cacheable
+            # Only cache results that contain segments
+            if cache is not None and entry["segments"]:
+                cache.put(key, entry)
         
-        # Create parent directory if it doesn't exist
-        os.makedirs(os.path.dirname(srt_path), exist_ok=True)
+        if info is not None and cache is not None and entry["segments"]:
+            info["transcript_id"] = key  # For resync with corrected lyrics
         
-        # Write SRT file using a file object
-        writer = WriteSRT(os.path.dirname(srt_path))
-        with open(srt_path, 'w', encoding='utf-8') as srt_file:
-            writer.write_result(result, srt_file)
-            srt_file.flush()  # Ensure content is written
+        if info is not None:
+            if "vad" in entry:
+                info["vad"] = entry["vad"]
+            if replica:
+                info["replica"] = replica
+        cues = cues_from_segments(entry["segments"])
+        logger.info(f"SRT content preview (first 200 chars): {cues_to_srt(cues)[:200]}")
         
-        # Verify the content and format
-        with open(srt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            logger.info(f"SRT file content preview (first 200 chars): {content[:200]}")
-            
-            # Validate SRT format
-            if not content.strip():
-                raise ValueError("SRT file was created but is empty")
-            
-            # Check for basic SRT format (timestamps with -->)
-            if '-->' not in content:
-                raise ValueError("Generated file doesn't appear to be in SRT format (no timestamps found)")
-            
-            # Log the full path to avoid confusion
-            logger.info(f"Full SRT file path: {os.path.abspath(srt_path)}")
+        # Validate that we got timed segments
+        if not cues:
+            raise ValueError("Transcription produced no timed segments")
         
-        if not os.path.exists(srt_path):
-            raise FileNotFoundError(f"SRT file was not created at expected path: {srt_path}")
-            
-        logger.info(f"Successfully created SRT file at: {srt_path}")
-        return srt_path
+        logger.info(f"Successfully transcribed {len(cues)} segments")
+        return cues
         
     except Exception as e:
         logger.error(f"Error in transcribe_audio: {str(e)}", exc_info=True)
@@ -69,12 +177,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Transcribe audio file to SRT format.")
     parser.add_argument('pathMp3', type=str, help="Path to the MP3 file")
     parser.add_argument('modelSize', type=str, help="Whisper model size", nargs='?')
+    parser.add_argument('--engine', type=str, help="Transcription engine (whisper, faster-whisper, fake)")
     args = parser.parse_args()
         
     if args.modelSize is not None:
         modelSize = args.modelSize
         
-    transcribe_audio(args.pathMp3, modelSize)
+    cues = transcribe_audio(args.pathMp3, modelSize, engine=args.engine)
+    srt_path = args.pathMp3 + ".srt"
+    write_srt(cues, srt_path)
+    logger.info(f"Successfully created SRT file at: {srt_path}")
     
     
 
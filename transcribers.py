@@ -0,0 +1,136 @@
+import os
+import hashlib
+import logging
+import threading
+from model_registry import registry, replicas
+from metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# Engine used when a request does not name one
+DEFAULT_TRANSCRIBER = os.environ.get("LRC_SYNC_TRANSCRIBER", "whisper")
+# CTranslate2 weight type for faster-whisper (int8 keeps CPU nodes usable)
+FASTER_WHISPER_COMPUTE_TYPE = os.environ.get("LRC_SYNC_FASTER_WHISPER_COMPUTE_TYPE", "int8")
+
+class Transcriber:
+    """Speech-to-text engine used by transcribe_audio.
+
+    transcribe returns {"text", "language", "segments": [{"id", "start", "end", "text"}]},
+    with times in seconds; this is also what the transcript cache stores. Engines
+    with model replicas add "replica": the wait and occupancy of the copy used.
+    on_segment, if given, is called with each segment as soon as the engine has it."""
+    name = None
+
+    def load_audio(self, audio_path: str):
+        """Decode an audio file into whatever transcribe accepts as audio (None if unused)"""
+        return None
+
+    def transcribe(self, audio_path: str, model_size: str, device: str = None, decode_options: dict = None, audio=None,
+                   on_segment=None) -> dict:
+        raise NotImplementedError
+
+class WhisperTranscriber(Transcriber):
+    """openai-whisper (PyTorch)"""
+    name = "whisper"
+
+    def load_audio(self, audio_path: str):
+        import whisper
+        return whisper.load_audio(audio_path)
+
+    def transcribe(self, audio_path, model_size, device=None, decode_options=None, audio=None, on_segment=None):
+        logger.info(f"Getting Whisper model: {model_size}")
+        lease = {}
+        with replicas.acquire(model_size, device, lease) as model:
+            logger.info(f"Starting transcription for: {audio_path}")
+            with time_stage("transcribe"):
+                result = model.transcribe(audio if audio is not None else audio_path, **(decode_options or {}))
+        logger.info(f"Transcription result: {result['text'][:100]}...")
+
+        segments = [
+            {"id": seg["id"], "start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            for seg in result["segments"]
+        ]
+        # openai-whisper has no per-segment hook; report them all once decoding is done
+        for seg in segments if on_segment else ():
+            on_segment(seg)
+        return {"text": result["text"], "language": result.get("language"), "segments": segments, "replica": lease}
+
+def _load_faster_whisper_model(model_size: str, device: str = None):
+    from faster_whisper import WhisperModel
+    return WhisperModel(model_size, device=device or "auto", compute_type=FASTER_WHISPER_COMPUTE_TYPE)
+
+class FasterWhisperTranscriber(Transcriber):
+    """faster-whisper (CTranslate2), int8 quantized by default for CPU nodes"""
+    name = "faster-whisper"
+
+    def __init__(self):
+        # Shares the process registry and replica pool with Whisper, under its own engine name
+        registry.register_loader(self.name, _load_faster_whisper_model)
+
+    def load_audio(self, audio_path: str):
+        from faster_whisper import decode_audio
+        return decode_audio(audio_path, sampling_rate=16000)
+
+    def transcribe(self, audio_path, model_size, device=None, decode_options=None, audio=None, on_segment=None):
+        logger.info(f"Getting faster-whisper model: {model_size} ({FASTER_WHISPER_COMPUTE_TYPE})")
+        lease = {}
+        with replicas.acquire(model_size, device, lease, engine=self.name) as model:
+            logger.info(f"Starting transcription for: {audio_path}")
+            with time_stage("transcribe"):
+                segments, info = model.transcribe(audio if audio is not None else audio_path, **(decode_options or {}))
+                # segments is a lazy generator; decoding happens while iterating
+                decoded = []
+                for i, seg in enumerate(segments):
+                    decoded.append({"id": i, "start": seg.start, "end": seg.end, "text": seg.text})
+                    if on_segment:
+                        on_segment(decoded[-1])
+                segments = decoded
+        text = "".join(seg["text"] for seg in segments)
+        logger.info(f"Transcription result: {text[:100]}...")
+
+        return {"text": text, "language": info.language, "segments": segments, "replica": lease}
+
+class FakeTranscriber(Transcriber):
+    """Deterministic engine for tests: one segment per line, derived from the audio (or file) bytes only"""
+    name = "fake"
+
+    def __init__(self, lines=None, seconds_per_line: float = 2.5):
+        self.lines = lines
+        self.seconds_per_line = seconds_per_line
+
+    def transcribe(self, audio_path, model_size, device=None, decode_options=None, audio=None, on_segment=None):
+        lines = self.lines
+        if lines is None:
+            if audio is not None:
+                digest = hashlib.sha256(audio.tobytes()).hexdigest()
+            else:
+                with open(audio_path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            lines = [f"line {i + 1} {digest[i * 8:(i + 1) * 8]}" for i in range(4)]
+        segments = [
+            {"id": i, "start": i * self.seconds_per_line, "end": (i + 1) * self.seconds_per_line, "text": f" {line}"}
+            for i, line in enumerate(lines)
+        ]
+        for seg in segments if on_segment else ():
+            on_segment(seg)
+        return {"text": "".join(seg["text"] for seg in segments), "language": "en", "segments": segments}
+
+TRANSCRIBERS = {
+    WhisperTranscriber.name: WhisperTranscriber,
+    FasterWhisperTranscriber.name: FasterWhisperTranscriber,
+    FakeTranscriber.name: FakeTranscriber,
+}
+_instances = {}
+_instances_lock = threading.Lock()
+
+def get_transcriber(engine=None) -> Transcriber:
+    """Transcriber for an engine name (default LRC_SYNC_TRANSCRIBER), or engine itself if already one"""
+    if isinstance(engine, Transcriber):
+        return engine
+    name = engine or DEFAULT_TRANSCRIBER
+    if name not in TRANSCRIBERS:
+        raise ValueError(f"Unknown transcription engine: {name} (available: {', '.join(TRANSCRIBERS)})")
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = TRANSCRIBERS[name]()
+        return _instances[name]
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("LRC_SYNC_TRANSCRIPT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "lrc-sync", "transcripts"))
+DEFAULT_MAX_MB = int(os.environ.get("LRC_SYNC_TRANSCRIPT_CACHE_MB", "1024"))
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(audio_hash: str, model_size: str, options: dict = None) -> str:
+    """Key for a transcription of the given audio with the given model and decode options"""
+    options_json = json.dumps(options or {}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{audio_hash}|{model_size}|{options_json}".encode('utf-8')).hexdigest()
+
+def is_transcript_id(key: str) -> bool:
+    """Whether key looks like a cache_key (and so is safe to use as a file name)"""
+    return len(key) == 64 and all(c in "0123456789abcdef" for c in key)
+
+class TranscriptCache:
+    """On-disk JSON cache of transcription results with size-bounded LRU eviction.
+
+    Entries are written to a temp file and renamed into place, so several
+    workers (or processes) can share one directory safely."""
+    suffix = ".json"
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_mb: int = DEFAULT_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key: str):
+        """Return the cached entry or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        self._hit(path)
+        return entry
+
+    def _hit(self, path: str):
+        # Touch so eviction sees this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, entry: dict):
+        """Atomically store an entry, then evict old entries over the size budget"""
+        self._write(key, lambda f: f.write(json.dumps(entry, default=float).encode('utf-8')))
+        self.evict()
+
+    def _write(self, key: str, write):
+        """Write an entry through write(binary file) into a temp file, then rename it into place"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        if self.max_bytes <= 0:
+            return
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if not e.name.endswith(self.suffix):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                logger.info(f"Evicted cache entry: {path}")
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+_cache = None
+
+def get_cache():
+    """Shared cache instance, or None when disabled with LRC_SYNC_TRANSCRIPT_CACHE_MB=0"""
+    global _cache
+    if _cache is None and DEFAULT_MAX_MB > 0:
+        _cache = TranscriptCache()
+    return _cache
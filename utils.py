@@ -1,17 +1,13 @@
 import os
-import requests
-import re
+from metrics import time_stage
+from SrtCue import iter_srt_file
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
 def download_mp3(url: str) -> str:
     """Download MP3 from URL to a temporary file and return the path"""
-    with NamedTemporaryFile(suffix='.mp3', delete=False) as tmp_file:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        for chunk in response.iter_content(chunk_size=8192):
-            tmp_file.write(chunk)
-        return tmp_file.name
+    from downloader import get_downloader  # requests is only needed here, not by the SRT/LRC tools
+    return get_downloader().download(url, suffix='.mp3')
 
 def format_text(text):
     """Format text by adding proper spacing around punctuation"""
@@ -21,127 +17,72 @@ def format_text(text):
     text = text.replace(' ,', ',').replace(',  ', ', ')
     return text
 
+def clean_lrc_text(text_lines):
+    """Drop block numbers, timing lines and section headers; return the joined text or None"""
+    cleaned_lines = []
+    for line in text_lines:
+        line = line.strip()
+        if line and not line.isdigit() and '-->' not in line:
+            # Remove section headers and single quotes
+            if not (line.startswith('[') and line.endswith(']')):
+                line = line.strip("'")
+                if line:
+                    cleaned_lines.append(line)
+    
+    if not cleaned_lines:
+        return None
+        
+    # Join cleaned lines with newlines
+    return '\n'.join(cleaned_lines)
+
+def lrc_timestamp(total_seconds: float) -> str:
+    """Format seconds as [mm:ss.xx]"""
+    minutes = int(total_seconds // 60)
+    seconds = total_seconds % 60
+    return f"[{minutes:02d}:{seconds:05.2f}]"
+
+def cues_to_lrc_json(cues) -> dict:
+    """Convert SrtCue objects to LRC JSON format"""
+    with time_stage("lrc"):
+        return _cues_to_lrc_json(cues)
+
+def _cues_to_lrc_json(cues) -> dict:
+    lines = cues_to_lrc_lines(cues)
+    if not lines:
+        print("Warning: No valid LRC lines were generated")
+        
+    return {"lines": lines}
+
+def cues_to_lrc_lines(cues) -> list:
+    """LRC {"timestamp", "text"} lines for the cues that have text left after cleaning"""
+    lines = []
+    for cue in cues:
+        text = clean_lrc_text(cue.text.split('\n'))
+        if text is None:
+            continue
+        # Same float arithmetic as parsing h:m:s,ms so the rounding matches srt_to_lrc_json
+        whole_seconds, ms = divmod(cue.start, 1000)
+        lines.append({
+            "timestamp": lrc_timestamp(float(whole_seconds) + ms / 1000),
+            "text": format_text(text)
+        })
+    return lines
+
 def srt_to_lrc_json(srt_path: str) -> dict:
     """Convert SRT file to LRC JSON format"""
+    with time_stage("lrc"):
+        return _srt_to_lrc_json(srt_path)
+
+def _srt_to_lrc_json(srt_path: str) -> dict:
     print(f"Processing SRT file: {srt_path}")  # Debug
     print(f"Absolute path: {os.path.abspath(srt_path)}")  # Debug
     
     if not os.path.exists(srt_path):
         print(f"Error: SRT file not found at {srt_path}")
         return {"lines": []}
-        
-    with open(srt_path, 'r', encoding='utf-8') as f:
-        content = f.readlines()
     
-    print(f"Read {len(content)} lines")  # Debug
-    print("First 10 lines of content:")  # Debug
-    for i, line in enumerate(content[:10]):
-        print(f"Line {i+1}: {line.rstrip()}")  # Debug
-
-    if not content:
-        print("Error: SRT file is empty")
-        return {"lines": []}
-        
-    # Validate basic SRT format
-    has_timestamps = False
-    for line in content[:10]:  # Check first 10 lines
-        if '-->' in line:
-            has_timestamps = True
-            break
-    
-    if not has_timestamps:
-        print("Error: File doesn't appear to be in SRT format (no timestamps found in first 10 lines)")
-        return {"lines": []}
-
-    lines = []
-    current_block = []
-    
-    def process_block(timestamp_line, text_lines):
-        if not text_lines or not timestamp_line:
-            return None
-            
-        # Clean and validate timestamp line
-        if '-->' not in timestamp_line:
-            return None
-            
-        # Clean up text lines first
-        cleaned_lines = []
-        for line in text_lines:
-            line = line.strip()
-            if line and not line.isdigit() and '-->' not in line:
-                # Remove section headers and single quotes
-                if not (line.startswith('[') and line.endswith(']')):
-                    line = line.strip("'")
-                    if line:
-                        cleaned_lines.append(line)
-        
-        if not cleaned_lines:
-            return None
-            
-        # Join cleaned lines with newlines
-        text = '\n'.join(cleaned_lines)
-        
-        # Parse timestamp
-        try:
-            start_time = timestamp_line.split('-->')[0].strip()
-            parts = re.split('[,:]', start_time)
-            if len(parts) >= 4:  # Ensure we have h:m:s,ms format
-                h, m, s = map(float, parts[:3])
-                ms = float('0.' + parts[3]) if len(parts) > 3 else 0
-                total_seconds = h * 3600 + m * 60 + s + ms
-                
-                # Format as [mm:ss.xx]
-                minutes = int(total_seconds // 60)
-                seconds = total_seconds % 60
-                timestamp = f"[{minutes:02d}:{seconds:05.2f}]"
-                
-                print(f"Created entry: {timestamp} {text}")  # Debug
-                return {
-                    "timestamp": timestamp,
-                    "text": format_text(text)
-                }
-        except (ValueError, IndexError) as e:
-            print(f"Error processing timestamp {start_time}: {e}")
-            return None
-            
-        return None
-
-    # Process content
-    for line in content:
-        line = line.rstrip('\n')
-        
-        if not line.strip():
-            if current_block:
-                # Find timestamp line (contains -->)
-                timestamp_line = next((l for l in current_block if '-->' in l), None)
-                if timestamp_line:
-                    # Get text lines (everything after timestamp)
-                    text_start = current_block.index(timestamp_line) + 1
-                    text_lines = current_block[text_start:]
-                    
-                    entry = process_block(timestamp_line, text_lines)
-                    if entry:
-                        lines.append(entry)
-                
-                current_block = []
-        else:
-            current_block.append(line)
-    
-    # Process last block if exists
-    if current_block:
-        timestamp_line = next((l for l in current_block if '-->' in l), None)
-        if timestamp_line:
-            text_start = current_block.index(timestamp_line) + 1
-            text_lines = current_block[text_start:]
-            
-            entry = process_block(timestamp_line, text_lines)
-            if entry:
-                lines.append(entry)
-    
-    if not lines:
-        print("Warning: No valid LRC lines were generated")
-        
-    return {"lines": lines}
+    # Cues are parsed lazily, so huge files are never held in memory as a whole
+    return _cues_to_lrc_json(iter_srt_file(srt_path))
 
 def cleanup_temp_files(file_paths: list):
     """Clean up temporary files"""
@@ -0,0 +1,148 @@
+"""
+Energy-based vocal activity detection on decoded 16 kHz mono audio.
+
+Finds the sung regions of a track so long instrumental or silent stretches are
+not fed to the transcriber, and maps transcript times back to the original audio.
+"""
+import os
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# LRC_SYNC_VAD=0 transcribes whole tracks
+VAD_ENABLED = os.environ.get("LRC_SYNC_VAD", "1") != "0"
+
+class VoiceActivity:
+    """Voiced regions of a track, as (start, end) sample offsets, and the time mapping they imply"""
+
+    def __init__(self, regions, total_samples: int, sample_rate: int = SAMPLE_RATE):
+        self.regions = [(int(start), int(end)) for start, end in regions]
+        self.total_samples = total_samples
+        self.sample_rate = sample_rate
+        # Start of each region in the trimmed (concatenated) audio
+        lengths = [end - start for start, end in self.regions]
+        self._trimmed_starts = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    @property
+    def voiced_samples(self) -> int:
+        return int(self._trimmed_starts[-1])
+
+    @property
+    def audio_seconds(self) -> float:
+        return self.total_samples / self.sample_rate
+
+    @property
+    def voiced_seconds(self) -> float:
+        return self.voiced_samples / self.sample_rate
+
+    @property
+    def skipped_seconds(self) -> float:
+        return (self.total_samples - self.voiced_samples) / self.sample_rate
+
+    def trim(self, audio):
+        """Concatenate the voiced regions of audio"""
+        if not self.regions:
+            return audio[:0]
+        if self.regions == [(0, len(audio))]:
+            return audio
+        return np.concatenate([audio[start:end] for start, end in self.regions])
+
+    def to_original(self, seconds: float, end: bool = False) -> float:
+        """Map a time in the trimmed audio back to the original track.
+
+        A time on the boundary between two regions belongs to the later one,
+        or to the earlier one for segment ends (end=True)."""
+        if not self.regions:
+            return seconds
+        sample = min(max(seconds * self.sample_rate, 0), self.voiced_samples)
+        side = 'left' if end else 'right'
+        k = int(np.searchsorted(self._trimmed_starts, sample, side=side)) - 1
+        k = min(max(k, 0), len(self.regions) - 1)
+        return (self.regions[k][0] + sample - self._trimmed_starts[k]) / self.sample_rate
+
+    def map_segments(self, segments: list) -> list:
+        """Segments timed on the trimmed audio, retimed on the original track"""
+        return [
+            dict(seg, start=self.to_original(seg["start"]), end=self.to_original(seg["end"], end=True))
+            for seg in segments
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "audio_seconds": round(self.audio_seconds, 3),
+            "voiced_seconds": round(self.voiced_seconds, 3),
+            "skipped_seconds": round(self.skipped_seconds, 3),
+            "regions": len(self.regions),
+        }
+
+def frame_energy_db(audio, sample_rate: int = SAMPLE_RATE, frame_ms: int = 30, band=(200.0, 4000.0)):
+    """Per-frame energy (dB) in the vocal frequency band"""
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[:n_frames * frame], dtype=np.float32).reshape(n_frames, frame)
+    spectrum = np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=1)
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)
+    in_band = (freqs >= band[0]) & (freqs <= band[1])
+    power = (np.abs(spectrum[:, in_band]) ** 2).sum(axis=1) / frame
+    return 10.0 * np.log10(power + 1e-10)
+
+def _runs(mask):
+    """(start, end) index pairs of the True runs in a boolean array"""
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def detect_voice(audio, sample_rate: int = SAMPLE_RATE, frame_ms: int = 30, margin_db: float = 8.0,
+                 range_db: float = 40.0, min_voiced_ms: int = 300, min_gap_ms: int = 1500, pad_ms: int = 250) -> VoiceActivity:
+    """Find voiced regions: frames louder (in the vocal band) than both the noise floor
+    plus margin_db and the loud level minus range_db, with short gaps bridged, short
+    blips dropped and pad_ms kept around each region"""
+    frame = int(sample_rate * frame_ms / 1000)
+    db = frame_energy_db(audio, sample_rate, frame_ms)
+    if len(db) == 0:
+        return VoiceActivity([(0, len(audio))] if len(audio) else [], len(audio), sample_rate)
+
+    threshold = max(np.percentile(db, 10) + margin_db, np.percentile(db, 95) - range_db)
+    voiced = db > threshold
+
+    # Bridge short gaps, then drop short voiced blips
+    starts, ends = _runs(~voiced)
+    for start, end in zip(starts, ends):
+        if 0 < start and end < len(voiced) and (end - start) * frame_ms < min_gap_ms:
+            voiced[start:end] = True
+    starts, ends = _runs(voiced)
+    keep = (ends - starts) * frame_ms >= min_voiced_ms
+
+    pad = int(sample_rate * pad_ms / 1000)
+    regions = []
+    for start, end in zip(starts[keep] * frame, ends[keep] * frame):
+        start, end = max(int(start) - pad, 0), min(int(end) + pad, len(audio))
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    if regions and len(audio) - regions[-1][1] < frame:
+        regions[-1] = (regions[-1][0], len(audio))  # Include the partial last frame
+    return VoiceActivity(regions, len(audio), sample_rate)
+
+def test_vad():
+    rng = np.random.default_rng(0)
+    t = np.arange(SAMPLE_RATE * 20) / SAMPLE_RATE
+    audio = (rng.standard_normal(len(t)) * 0.001).astype(np.float32)
+    sung = ((t >= 5) & (t < 9)) | ((t >= 14) & (t < 17))
+    audio[sung] += (0.3 * np.sin(2 * np.pi * 440 * t[sung])).astype(np.float32)
+
+    activity = detect_voice(audio)
+    print(activity.regions, activity.stats())
+    assert len(activity.regions) == 2
+    assert abs(activity.voiced_seconds - 8.0) < 0.2  # 7 s sung plus padding
+    first = activity.regions[0][1] - activity.regions[0][0]
+    assert abs(activity.to_original(0.0) - 4.75) < 0.1
+    assert abs(activity.to_original(first / SAMPLE_RATE) - 13.75) < 0.1
+    assert abs(activity.to_original(first / SAMPLE_RATE, end=True) - 9.25) < 0.1
+    assert len(activity.trim(audio)) == activity.voiced_samples
+    print("VAD OK")
+
+if __name__ == "__main__":
+    test_vad()
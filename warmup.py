@@ -0,0 +1,67 @@
+import os
+import time
+import threading
+import logging
+import numpy as np
+from transcribers import get_transcriber
+from vad import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Model sizes loaded and exercised before the service reports ready ("" skips warm-up)
+WARMUP_MODELS = [size.strip() for size in os.environ.get("LRC_SYNC_WARMUP_MODELS", "large").split(",") if size.strip()]
+# Engine to warm up (default: LRC_SYNC_TRANSCRIBER)
+WARMUP_ENGINE = os.environ.get("LRC_SYNC_WARMUP_ENGINE") or None
+
+class Warmup:
+    """Loads models and runs one dummy decode per model size, in the background.
+
+    Readiness follows it: not ready until every model is warm, and never ready if warm-up failed."""
+
+    def __init__(self, models=WARMUP_MODELS, engine=WARMUP_ENGINE, device: str = None):
+        self.models = list(models)
+        self.engine = engine
+        self.device = device
+        self.status = "pending"
+        self.error = None
+        self.seconds = {}  # model size -> warm-up time
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="lrc-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        self.status = "running"
+        try:
+            transcriber = get_transcriber(self.engine)
+            silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+            for model_size in self.models:
+                logger.info(f"Warming up {transcriber.name} model {model_size}")
+                start = time.perf_counter()
+                # Loads the model (and its first replica) and runs a short decode
+                transcriber.transcribe("<warmup>", model_size, self.device, {}, silence)
+                self.seconds[model_size] = round(time.perf_counter() - start, 3)
+                logger.info(f"Model {model_size} warm in {self.seconds[model_size]:.2f}s")
+            self.status = "done"
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}", exc_info=True)
+            self.error = {"error": str(e), "type": type(e).__name__}
+            self.status = "failed"
+        finally:
+            self._done.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "done"
+
+    def to_dict(self) -> dict:
+        data = {"status": self.status, "models": self.models, "seconds": self.seconds}
+        if self.error is not None:
+            data["error"] = self.error
+        return data